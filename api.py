@@ -0,0 +1,165 @@
+"""Batch summarize endpoint for scripted crosstabs.
+
+``POST /api/summarize`` takes a JSON list of specs, or ``{"specs": [...], "format": ...}``:
+
+    [{"year": 2019, "weights": "pesoano", "sumvar": "ht11", "by": ["dpto"],
+      "aggfunc": "mean", "is_categorical": false, "household_level": true}]
+
+An optional ``"where"`` restricts a spec to a subpopulation, e.g. employed people aged
+14 to 65: ``{"conditions": [{"variable": "pobpcoac", "values": [2]},
+{"variable": "e27", "low": 14, "high": 65}], "any": false}``.
+
+Specs are grouped by year so each survey is loaded once, and run on a bounded thread
+pool. Results are streamed back as they finish, in completion order, either as NDJSON
+(the default, one object per spec with its `index` in the request) or, with
+``"format": "arrow"`` or ``Accept: application/vnd.apache.arrow.stream``, as
+concatenated Arrow IPC streams whose schema metadata carries `index`, `spec` and `error`.
+"""
+from __future__ import annotations
+
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import orjson
+import pandas as pd
+import pyarrow as pa
+from flask import Blueprint, Response, jsonify, request
+
+from cache import YEARS, frame_to_arrow
+from bitmaps import Filter
+from results import SummarySpec, frame_records
+
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+NDJSON = "application/x-ndjson"
+AGGFUNCS = ("mean", "sum", "count")
+DEFAULT_API_WORKERS = 4
+DEFAULT_MAX_SPECS = 500
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("PYECH_API_WORKERS", DEFAULT_API_WORKERS)),
+    thread_name_prefix="api",
+)
+
+
+class SpecError(ValueError):
+    pass
+
+
+def parse_spec(item: dict) -> SummarySpec:
+    if not isinstance(item, dict):
+        raise SpecError("Each spec must be an object.")
+    missing = [k for k in ("year", "weights", "sumvar") if not item.get(k)]
+    if missing:
+        raise SpecError(f"Missing fields: {', '.join(missing)}")
+    try:
+        year = int(item["year"])
+    except (TypeError, ValueError):
+        raise SpecError(f"Invalid year: {item['year']!r}")
+    if year not in YEARS:
+        raise SpecError(f"Year {year} is not available.")
+    aggfunc = item.get("aggfunc", "mean")
+    if aggfunc not in AGGFUNCS:
+        raise SpecError(f"Unsupported aggfunc: {aggfunc!r}")
+    try:
+        Filter.create(item.get("where"))
+    except (TypeError, ValueError) as e:
+        raise SpecError(f"Invalid where: {e}")
+    return SummarySpec.create(
+        year,
+        item["weights"],
+        item["sumvar"],
+        item.get("by"),
+        aggfunc,
+        item.get("is_categorical"),
+        item.get("household_level", False),
+        item.get("errors", False),
+        item.get("where"),
+    )
+
+
+def run_batch(
+    specs: List[SummarySpec], registry, get_summary: Callable[[SummarySpec], pd.DataFrame]
+) -> Iterator[Tuple[int, SummarySpec, Optional[pd.DataFrame], Optional[str]]]:
+    """Yield `(index, spec, summary, error)` for every spec as soon as it is computed."""
+    by_year = defaultdict(list)
+    for index, spec in enumerate(specs):
+        by_year[spec.year].append((index, spec))
+    pending = {registry.submit(year): (None, year) for year in by_year}
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            item, year = pending.pop(future)
+            error = future.exception()
+            if item is not None:
+                index, spec = item
+                if error is None:
+                    yield index, spec, future.result(), None
+                else:
+                    yield index, spec, None, f"{type(error).__name__}: {error}"
+                continue
+            for index, spec in by_year[year]:
+                if error is None:
+                    summary: Future = _executor.submit(get_summary, spec)
+                    pending[summary] = ((index, spec), year)
+                else:
+                    yield index, spec, None, f"Error al cargar {year}: {error}"
+
+
+def ndjson_line(index: int, spec: SummarySpec, summary, error) -> bytes:
+    line = {"index": index, "spec": spec._asdict(), "error": error}
+    if summary is not None:
+        line["columns"] = list(summary.columns)
+        line["data"] = frame_records(summary)
+    # The spec's filter is a named tuple, written as a list like the rest of the spec.
+    return orjson.dumps(line, default=list, option=orjson.OPT_APPEND_NEWLINE)
+
+
+def arrow_stream(index: int, spec: SummarySpec, summary, error) -> bytes:
+    table = frame_to_arrow(summary if summary is not None else pd.DataFrame())
+    metadata = {
+        "index": str(index),
+        "spec": json.dumps(spec._asdict()),
+        "error": error or "",
+    }
+    table = table.replace_schema_metadata(metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def create_blueprint(registry, get_summary: Callable[[SummarySpec], pd.DataFrame]) -> Blueprint:
+    api = Blueprint("api", __name__, url_prefix="/api")
+    max_specs = int(os.environ.get("PYECH_API_MAX_SPECS", DEFAULT_MAX_SPECS))
+
+    @api.route("/summarize", methods=["POST"])
+    def summarize():
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            items, output = body.get("specs"), body.get("format")
+        else:
+            items, output = body, None
+        if output is None:
+            output = "arrow" if request.accept_mimetypes.best == ARROW_STREAM else "ndjson"
+        if output not in ("ndjson", "arrow"):
+            return jsonify(error=f"Unsupported format: {output!r}"), 400
+        if not isinstance(items, list) or not items:
+            return jsonify(error="Expected a non-empty list of specs."), 400
+        if len(items) > max_specs:
+            return jsonify(error=f"At most {max_specs} specs per request."), 400
+        try:
+            specs = [parse_spec(item) for item in items]
+        except SpecError as e:
+            return jsonify(error=str(e)), 400
+        encode = arrow_stream if output == "arrow" else ndjson_line
+        results = run_batch(specs, registry, get_summary)
+        return Response(
+            (encode(*result) for result in results),
+            mimetype=ARROW_STREAM if output == "arrow" else NDJSON,
+        )
+
+    return api
@@ -1,17 +1,39 @@
+from __future__ import annotations
+
+import lazy
+
+# Imported on first use so that a cold worker answers before they finish loading.
+lazy.defer("numpy", "pandas", "pyarrow", "pyech")
+
 import ast
+import math
+from functools import partial
 
 import dash_bootstrap_components as dbc
-import plotly.express as px
 import pandas as pd
-import plotly.io as pio
-from pyech import ECH
-from dash import html, dcc, Dash, callback_context
+from dash import html, dcc, Dash, callback_context, no_update
 from dash.exceptions import PreventUpdate
-from dash.dependencies import Input, Output, State
-from dash_bootstrap_templates import load_figure_template
+from dash.dependencies import ClientsideFunction, Input, Output, State
 from dash.dash_table import DataTable
 from dash.dash_table.Format import Format, Scheme, Trim
 
+import api
+import export
+import metrics
+from cache import SurveyCache
+from charts import OTHERS, collapse, collapse_limits, max_facets
+from columnstore import ColumnStore
+from compression import init_compression
+from cube import materialize
+from dictionary import DictionaryIndex, query_table
+from engine import ERROR_COLUMNS, AggregationEngine
+from households import load_households
+from metrics import phase, timed
+from registry import DOWNLOADING, FAILED, PARSING, QUEUED, READY, SurveyRegistry
+from results import ResultStore, SummaryCache, SummarySpec, frame_records
+from theme import load_theme
+from timeseries import summarize_years
+
 
 stylesheet = dbc.themes.FLATLY
 dbc_css = (
@@ -24,14 +46,12 @@ app = Dash(
     external_stylesheets=[stylesheet, dbc_css],
     meta_tags=[{"name": "viewport", "content": "width=device-width, initial-scale=1"}],
     suppress_callback_exceptions=True,
+    # Configured by init_compression instead.
+    compress=False,
 )
 
 server = app.server
 
-template = "flatly"
-load_figure_template(template)
-pio.templates[template].layout.margin = {"l": 10, "r": 10}
-
 
 def dbc_dropdown(dropdown: dcc.Dropdown):
     return html.Div(dropdown, className="dash-bootstrap")
@@ -227,9 +247,135 @@ SUMMARIZER = html.Div(
                             md=2,
                         ),
                     ]
-                )
+                ),
+                dbc.Row(
+                    [
+                        dbc.Col(
+                            dbc.Checklist(
+                                id="series",
+                                options=[{"label": "Serie temporal", "value": "series"}],
+                                value=[],
+                                switch=True,
+                            ),
+                            md=2,
+                            class_name="mb-2",
+                        ),
+                        dbc.Col(
+                            [
+                                dbc.Checklist(
+                                    id="errors",
+                                    options=[{"label": "Errores estándar", "value": "errors"}],
+                                    value=[],
+                                    switch=True,
+                                ),
+                                html.Small(
+                                    "Aproximados: cada hogar se toma como unidad de muestreo, "
+                                    "sin los estratos ni las UPM del diseño de la ECH.",
+                                    className="text-muted",
+                                ),
+                            ],
+                            md=3,
+                            class_name="mb-2",
+                        ),
+                        dbc.Col(
+                            dcc.RangeSlider(
+                                id="series-years",
+                                min=2007,
+                                max=2020,
+                                step=1,
+                                value=[2007, 2020],
+                                marks={i: str(i) for i in range(2007, 2021)},
+                                disabled=True,
+                            ),
+                            md=7,
+                        ),
+                    ]
+                ),
+                dbc.Row(
+                    [
+                        dbc.Col(
+                            [
+                                dbc.Label("Filtrar población"),
+                                dbc_dropdown(
+                                    dcc.Dropdown(
+                                        id="filter-variable",
+                                        disabled=True,
+                                        placeholder="Variable",
+                                    )
+                                ),
+                            ],
+                            md=3,
+                            class_name="mb-2",
+                        ),
+                        dbc.Col(
+                            [
+                                dbc.Label("Valores"),
+                                dbc_dropdown(
+                                    dcc.Dropdown(
+                                        id="filter-values",
+                                        multi=True,
+                                        placeholder="Valores",
+                                    )
+                                ),
+                            ],
+                            md=3,
+                            class_name="mb-2",
+                        ),
+                        dbc.Col(
+                            [
+                                dbc.Label("Rango"),
+                                dbc.InputGroup(
+                                    [
+                                        dbc.Input(id="filter-low", type="number", placeholder="Desde"),
+                                        dbc.Input(id="filter-high", type="number", placeholder="Hasta"),
+                                    ]
+                                ),
+                            ],
+                            md=2,
+                            class_name="mb-2",
+                        ),
+                        dbc.Col(
+                            [
+                                dbc.Label("Combinar condiciones"),
+                                dbc.RadioItems(
+                                    id="filter-mode",
+                                    options=[
+                                        {"label": "Todas (Y)", "value": "all"},
+                                        {"label": "Alguna (O)", "value": "any"},
+                                    ],
+                                    value="all",
+                                    inline=True,
+                                ),
+                            ],
+                            md=2,
+                            class_name="mb-2",
+                        ),
+                        dbc.Col(
+                            [
+                                dbc.Button(
+                                    "Agregar filtro",
+                                    id="add-filter",
+                                    size="sm",
+                                    color="primary",
+                                    class_name="me-2",
+                                ),
+                                dbc.Button(
+                                    "Quitar filtros",
+                                    id="clear-filters",
+                                    size="sm",
+                                    color="secondary",
+                                    outline=True,
+                                ),
+                            ],
+                            md=2,
+                            class_name="mb-2 d-flex align-items-end",
+                        ),
+                    ]
+                ),
+                html.Div(id="filter-summary", className="mb-2"),
             ]
         ),
+        html.Div(id="series-warnings"),
         html.Br(),
     ],
 )
@@ -296,7 +442,12 @@ RESULTS = dbc.Fade(
     dbc.Accordion(
         [
             dbc.AccordionItem(
-                [html.Br(), CONTROLS, html.Br(), html.Div(id="chart-div")],
+                [
+                    html.Br(),
+                    CONTROLS,
+                    html.Br(),
+                    html.Div(dcc.Graph(id="chart"), id="chart-div"),
+                ],
                 title="Gráfico interactivo",
             ),
             dbc.AccordionItem(
@@ -350,13 +501,7 @@ app.layout = html.Div(
                         html.Br(),
                         html.H5("Seleccionar año de encuesta y ponderador"),
                         SURVEY_CHOICE,
-                        html.P("🕑 Cargar cada encuesta puede llevar entre 20 y 40 segundos dependiendo del año.", className="text-muted mt-2"),
-                        dcc.Loading(
-                            html.Div(id="placeholder-1", hidden=True),
-                            type="dot",
-                            fullscreen=True,
-                            style={"backgroundColor": "rgba(250, 250, 250, 0.5)"},
-                        ),
+                        html.P("🕑 Los años ya cargados están disponibles al instante. La primera vez que se pide un año se descarga en segundo plano; el avance se muestra en la barra de carga.", className="text-muted mt-2"),
                     ],
                     is_open=True,
                     id="offcanvas",
@@ -370,12 +515,8 @@ app.layout = html.Div(
                 ),
                 #dbc.Toast("📈 Encuesta cargada.", id="toast", color="success", duration=5000, dismissable=True,
                 #            is_open=False),
-                dcc.Loading(
-                    html.Div(id="placeholder-2", hidden=True),
-                    type="dot",
-                    fullscreen=True,
-                    style={"backgroundColor": "rgba(250, 250, 250, 0.5)"},
-                ),
+                html.Div(id="load-status", className="mb-3"),
+                dcc.Interval(id="load-interval", interval=1000, disabled=True),
                 dbc.Tabs(
                     [
                         dbc.Tab(
@@ -387,6 +528,9 @@ app.layout = html.Div(
                 ),
                 html.Br(),
                 dcc.Store(id="sum-data"),
+                dcc.Store(id="filters", data=[]),
+                dcc.Store(id="chart-data"),
+                dcc.Store(id="chart-settings", data=load_theme()),
             ],
             fluid=True,
         ),
@@ -423,7 +567,30 @@ def toggle_navbar_collapse(n, is_open):
     return is_open
 
 
-survey = ECH()
+registry = SurveyRegistry(loader=timed("load")(SurveyCache().load))
+registry.register(
+    "engine",
+    lambda survey: AggregationEngine(
+        survey,
+        # Precomputing every column would read all of a lazily loaded survey; only the
+        # bitmaps of the commonly filtered columns are built with it.
+        precompute=not isinstance(survey.data, ColumnStore),
+        households=load_households(survey),
+    ),
+)
+registry.register("dictionary_index", lambda survey: DictionaryIndex(survey.dictionary))
+registry.on_ready(partial(materialize, registry))
+summary_cache = SummaryCache()
+result_store = ResultStore()
+metrics.register_gauges("registry", registry.stats)
+metrics.register_gauges("summary_cache", summary_cache.stats)
+metrics.register_route(server)
+
+LOAD_PROGRESS = {
+    QUEUED: (10, "En cola"),
+    DOWNLOADING: (40, "Descargando microdatos"),
+    PARSING: (80, "Procesando encuesta"),
+}
 
 
 @app.callback(
@@ -436,8 +603,8 @@ survey = ECH()
     Output("by", "options"),
     Output("open-offcanvas", "color"),
     Output("open-offcanvas", "children"),
-    Output("placeholder-1", "children"),
-    Output("placeholder-2", "children"),
+    Output("load-interval", "disabled"),
+    Output("load-status", "children"),
     Output("sumvar", "value"),
     Output("by", "value"),
     Output("dictionary-div", "children"),
@@ -445,32 +612,47 @@ survey = ECH()
     #Output("toast", "is_open"),
     Input("year", "value"),
     Input("weights", "value"),
+    Input("load-interval", "n_intervals"),
 )
-def set_survey_year_and_weights_and_create_dictionary(year, weights):
-    fully_loaded = False
+def set_survey_year_and_weights_and_create_dictionary(year, weights, n_intervals):
     ctx = callback_context
     trigger_id = ctx.triggered[0]["prop_id"].split(".")[0]
-    if trigger_id == "year":
-        survey.load(int(year), from_repo=True)
-        if weights:
-            survey.weights = weights
-            fully_loaded = True
-    elif trigger_id == "weights" and year:
-        survey.weights = weights
-        fully_loaded = True
+    status = None
+    if year:
+        registry.submit(year)
+        status = registry.status(year)
+    if status in LOAD_PROGRESS:
+        value, label = LOAD_PROGRESS[status]
+        progress = dbc.Progress(
+            value=value, label=label, striped=True, animated=True, style={"height": "20px"}
+        )
+        if trigger_id == "load-interval":
+            return (no_update,) * 9 + (False, progress) + (no_update,) * 4
+        load_status = (False, progress)
+    elif status == FAILED:
+        load_status = (
+            True,
+            dbc.Alert(f"Error al cargar la encuesta {year}: {registry.error(year)}", color="danger"),
+        )
     else:
-        pass
-    if fully_loaded:
+        load_status = (True, None)
+    if status == READY and weights:
+        with phase("load"):
+            survey = registry.view(year, weights).survey
         options = [{"label": survey.metadata.column_labels_and_names[i], "value": i} for i in survey.data.columns]
-        dictionary = DataTable(
-            data=survey.dictionary.to_dict("records"),
-            columns=[{"name": i, "id": i} for i in survey.dictionary.columns],
-            sort_action="native",
-            filter_action="native",
-            page_action="native",
-            page_size=50,
-            id="dictionary-table",
-        )
+        with phase("render"):
+            dictionary = DataTable(
+                columns=[{"name": i, "id": i} for i in survey.dictionary.columns],
+                sort_action="custom",
+                sort_mode="multi",
+                sort_by=[],
+                filter_action="custom",
+                filter_query="",
+                page_action="custom",
+                page_current=0,
+                page_size=50,
+                id="dictionary-table",
+            )
         return (
             False,
             False,
@@ -480,9 +662,8 @@ def set_survey_year_and_weights_and_create_dictionary(year, weights):
             options,
             options,
             "primary",
-            f">> Año: {survey.data['anio'][0]} | Ponderador: {survey.weights}",
-            0,
-            0,
+            f">> Año: {year} | Ponderador: {weights}",
+            *load_status,
             None,
             None,
             dictionary,
@@ -500,8 +681,7 @@ def set_survey_year_and_weights_and_create_dictionary(year, weights):
             [],
             "secondary",
             ">> Seleccionar encuesta y ponderador",
-            0,
-            0,
+            *load_status,
             None,
             None,
             None,
@@ -512,46 +692,267 @@ def set_survey_year_and_weights_and_create_dictionary(year, weights):
 
 @app.callback(
     Output("dictionary-table", "data"),
+    Output("dictionary-table", "page_count"),
+    Output("dictionary-table", "page_current"),
+    Input("dictionary-table", "page_current"),
+    Input("dictionary-table", "page_size"),
+    Input("dictionary-table", "sort_by"),
+    Input("dictionary-table", "filter_query"),
     Input("dictionary-search", "value"),
-    prevent_initial_call=True,
+    State("year", "value"),
 )
-def filter_dictionary(term):
-    if hasattr(survey, "dictionary"):
-        filtered = survey.search_dictionary(term)
-        return filtered.to_dict("records")
-    else:
+def filter_dictionary(page_current, page_size, sort_by, filter_query, term, year):
+    if not year:
         raise PreventUpdate
+    ctx = callback_context
+    trigger_id = ctx.triggered[0]["prop_id"]
+    with phase("load"):
+        index = registry.derived(year, "dictionary_index")
+    with phase("aggregate"):
+        filtered = query_table(index.frame.take(index.search(term)), filter_query, sort_by)
+    page_count = max(1, math.ceil(len(filtered) / page_size))
+    if trigger_id != "dictionary-table.page_current":
+        page_current = 0
+    page_current = min(page_current or 0, page_count - 1)
+    page = filtered.iloc[page_current * page_size : (page_current + 1) * page_size]
+    with phase("serialize"):
+        records = frame_records(page)
+    return records, page_count, page_current
+
+
+@app.callback(
+    Output("filter-variable", "options"),
+    Output("filter-variable", "disabled"),
+    Input("sumvar", "options"),
+)
+def set_filter_variables(options):
+    return options, not options
+
+
+@app.callback(
+    Output("filter-values", "options"),
+    Output("filter-values", "value"),
+    Input("filter-variable", "value"),
+    State("year", "value"),
+)
+def set_filter_values(variable, year):
+    if not variable or not year:
+        return [], None
+    with phase("load"):
+        view = registry.view(year)
+        engine = view.derived("engine")
+    if not engine.is_categorical(variable):
+        # Numeric variables are filtered by range.
+        return [], None
+    labels = view.survey.metadata.variable_value_labels.get(variable, {})
+    options = [
+        {"label": str(labels.get(v, v)), "value": v}
+        for v in engine.codes(variable).uniques.tolist()
+    ]
+    return options, None
+
+
+def describe_condition(condition: dict) -> str:
+    if condition["values"]:
+        return f"{condition['variable']}: {', '.join(map(str, condition['values']))}"
+    low = "" if condition["low"] is None else condition["low"]
+    high = "" if condition["high"] is None else condition["high"]
+    return f"{condition['variable']}: {low}–{high}"
+
+
+@app.callback(
+    Output("filters", "data"),
+    Output("filter-summary", "children"),
+    Input("add-filter", "n_clicks"),
+    Input("clear-filters", "n_clicks"),
+    Input("year", "value"),
+    State("filter-variable", "value"),
+    State("filter-values", "value"),
+    State("filter-low", "value"),
+    State("filter-high", "value"),
+    State("filters", "data"),
+)
+def update_filters(add, clear, year, variable, values, low, high, filters):
+    trigger_id = callback_context.triggered[0]["prop_id"].split(".")[0]
+    if trigger_id == "add-filter":
+        if not variable or not (values or low is not None or high is not None):
+            raise PreventUpdate
+        condition = {"variable": variable, "values": values or [], "low": low, "high": high}
+        filters = (filters or []) + [condition]
+    else:
+        # Filters refer to the variables of one year.
+        filters = []
+    badges = [
+        dbc.Badge(describe_condition(c), color="secondary", class_name="me-1")
+        for c in filters
+    ]
+    return filters, badges
+
+
+@app.callback(
+    Output("series-years", "disabled"),
+    Input("series", "value"),
+)
+def toggle_series_years(series):
+    return not series
 
 
 @app.callback(
     Output("sum-data", "data"),
     Output("results-fade", "is_in"),
+    Output("series-warnings", "children"),
     Input("sumvar", "value"),
     Input("by", "value"),
     Input("aggfunc", "value"),
     Input("is-categorical", "value"),
     Input("household", "value"),
     Input("weights", "value"),
+    Input("series", "value"),
+    Input("series-years", "value"),
+    Input("errors", "value"),
+    Input("filters", "data"),
+    Input("filter-mode", "value"),
+    State("year", "value"),
 )
-def summarize(sumvar, by, aggfunc, is_categorical, household_level, weights):
-    if sumvar:
+def summarize(
+    sumvar,
+    by,
+    aggfunc,
+    is_categorical,
+    household_level,
+    weights,
+    series,
+    series_years,
+    errors,
+    filters,
+    filter_mode,
+    year,
+):
+    if sumvar and year and weights:
         is_categorical = ast.literal_eval(is_categorical)
         household_level = ast.literal_eval(household_level)
-        summarized = survey.summarize(
+        spec = SummarySpec.create(
+            year,
+            weights,
             sumvar,
             by,
-            aggfunc=aggfunc,
-            is_categorical=is_categorical,
-            household_level=household_level,
+            aggfunc,
+            is_categorical,
+            household_level,
+            bool(errors),
+            {"conditions": filters, "any": filter_mode == "any"},
         )
-        summarized = summarized.reset_index()
-        records = summarized.to_dict("records")
-        return records, True
+        limits = chart_limits(spec)
+        if not series:
+            summarized = get_summary(spec)
+            with phase("serialize"):
+                handle = result_store.put(spec.handle, summarized)
+            payload = {
+                "handle": handle,
+                "spec": spec,
+                "columns": list(summarized.columns),
+                "labels": column_labels(year, summarized.columns),
+                "collapse": limits,
+            }
+            return payload, True, None
+        years = list(range(series_years[0], series_years[1] + 1))
+        summarized, missing = get_series(spec, years)
+        warnings = None
+        if missing:
+            warnings = dbc.Alert(
+                [html.Strong("Años omitidos: ")]
+                + [f"{y} ({reason}); " for y, reason in missing.items()],
+                color="warning",
+                class_name="mt-2",
+            )
+        if summarized.empty:
+            return None, False, warnings
+        with phase("serialize"):
+            handle = result_store.put(spec.series_handle(years), summarized)
+        payload = {
+            "handle": handle,
+            "spec": spec,
+            "years": years,
+            "columns": list(summarized.columns),
+            "labels": column_labels(year, summarized.columns),
+            "collapse": limits,
+        }
+        return payload, True, warnings
     else:
-        return None, False
+        return None, False, None
 
 
-@app.callback(
+def column_labels(year, columns) -> dict:
+    labels = registry.get(year).metadata.column_labels_and_names
+    return {c: labels[c] for c in columns if c in labels}
+
+
+def chart_limits(spec: SummarySpec) -> dict:
+    """Groupers of `spec` to collapse in the chart, estimated before aggregating."""
+    with phase("load"):
+        engine = registry.view(spec.year).derived("engine")
+    is_categorical = spec.is_categorical
+    if is_categorical is None:
+        is_categorical = engine.is_categorical(spec.sumvar)
+    groupers = list(spec.by) + ([spec.sumvar] if is_categorical else [])
+    return collapse_limits({c: engine.distinct(c) for c in groupers})
+
+
+def chart_summary(data: dict, summarized: pd.DataFrame, y: str) -> pd.DataFrame:
+    """The summary drawn in the chart, with the groupers in `data["collapse"]` collapsed."""
+    spec = SummarySpec.create(*data["spec"])
+    weights = None
+    if y != "Recuento" and spec.aggfunc == "mean":
+        # Merged means are weighted by the weight total of each group.
+        totals = spec._replace(aggfunc="count", errors=False)
+        if data.get("years"):
+            weights, _ = get_series(totals, data["years"])
+        else:
+            weights = get_summary(totals)
+    return collapse(summarized, data["collapse"], y, weights)
+
+
+def get_summary(spec: SummarySpec) -> pd.DataFrame:
+    def compute():
+        with phase("load"):
+            view = registry.view(spec.year, spec.weights)
+            engine = view.derived("engine")
+        with phase("aggregate"):
+            return engine.summarize(
+                spec.sumvar,
+                list(spec.by),
+                aggfunc=spec.aggfunc,
+                is_categorical=spec.is_categorical,
+                household_level=spec.household_level,
+                weights=view.weights,
+                cube=view.peek("cube"),
+                errors=spec.errors,
+                where=spec.where,
+            )
+
+    return summary_cache.get_or_compute(spec, compute)
+
+
+def get_series(spec: SummarySpec, years: list):
+    with phase("aggregate"):
+        return summarize_years(spec, years, cached=summary_cache.get, store=summary_cache.put)
+
+
+def resolve_summary(data: dict) -> pd.DataFrame:
+    summarized = result_store.get(data["handle"])
+    if summarized is None:
+        spec = SummarySpec.create(*data["spec"])
+        if data.get("years"):
+            summarized, _ = get_series(spec, data["years"])
+            result_store.put(spec.series_handle(data["years"]), summarized)
+        else:
+            summarized = get_summary(spec)
+            result_store.put(spec.handle, summarized)
+    return summarized
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace="charts", function_name="validate_values"),
     Output("x-axis", "value"),
     Output("color", "value"),
     Output("facet-col", "value"),
@@ -563,19 +964,10 @@ def summarize(sumvar, by, aggfunc, is_categorical, household_level, weights):
     Input("facet-row", "value"),
     Input("sumvar", "value"),
 )
-def validate_chart_values(data, x_axis, color, facet_col, facet_row, sumvar):
-    if not data:
-        raise PreventUpdate
-    data = pd.DataFrame.from_records(data, coerce_float=True, index="index")
-    values = [
-        x if x in data.columns else None for x in [x_axis, color, facet_col, facet_row]
-    ]
-    if "Recuento" in data.columns:
-        values[0] = sumvar
-    return values
 
 
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace="charts", function_name="control_options"),
     Output("x-axis", "options"),
     Output("color", "options"),
     Output("facet-col", "options"),
@@ -584,72 +976,58 @@ def validate_chart_values(data, x_axis, color, facet_col, facet_row, sumvar):
     Input("sum-data", "data"),
     Input("sumvar", "value"),
 )
-def set_chart_controls_options(by, data, sumvar):
-    if not data:
-        raise PreventUpdate
-    data = pd.DataFrame.from_records(data, coerce_float=True, index="index")
-    if by:
-        options = [{"label": survey.metadata.column_labels_and_names[i], "value": i} for i in by]
-    else:
-        options = []
-    if "Recuento" in data.columns:
-        return [{"label": survey.metadata.column_labels_and_names[sumvar], "value": sumvar}], options, options, options
-    else:
-        return options, options, options, options
 
 
-@app.callback(
-    Output("table-div", "children"),
-    Output("chart-div", "children"),
-    Input("sum-data", "data"),
-    Input("sumvar", "value"),
+app.clientside_callback(
+    ClientsideFunction(namespace="charts", function_name="bar_figure"),
+    Output("chart", "figure"),
+    Input("dash-table", "data"),
+    Input("chart-data", "data"),
     Input("x-axis", "value"),
     Input("color", "value"),
     Input("facet-col", "value"),
     Input("facet-row", "value"),
+    State("chart-settings", "data"),
+)
+
+
+@app.callback(
+    Output("table-div", "children"),
+    Output("chart-data", "data"),
+    Input("sum-data", "data"),
+    State("sumvar", "value"),
     State("weights", "value"),
     State("year", "value"),
 )
-def create_table_and_chart(
-    data, sumvar, x_axis, color, facet_col, facet_row, weights, year
-):
+def create_table(data, sumvar, weights, year):
     if not data:
         raise PreventUpdate
     if sumvar:
-        data = pd.DataFrame.from_records(data, coerce_float=True, index="index")
-        name_sumvar = survey.metadata.column_names_to_labels[sumvar]
-        if "Recuento" in data.columns:
-            plot = px.bar(
-                data,
-                x=x_axis,
-                y="Recuento",
-                color=color,
-                facet_col=facet_col,
-                facet_row=facet_row,
-                barmode="group",
-                color_discrete_sequence=px.colors.qualitative.Prism,
-                color_continuous_scale=px.colors.sequential.thermal,
-                template=template,
-                title=f"{name_sumvar} ({year}, {weights})",
-            )
+        if data.get("years"):
+            period = f"{data['years'][0]}-{data['years'][-1]}"
         else:
-            plot = px.bar(
-                data,
-                x=x_axis,
-                y=sumvar,
-                color=color,
-                facet_col=facet_col,
-                facet_row=facet_row,
-                barmode="group",
-                color_discrete_sequence=px.colors.qualitative.Prism,
-                color_continuous_scale=px.colors.sequential.thermal,
-                template=template,
-                title=f"{name_sumvar} ({year}, {weights})",
-            )
+            period = year
+        handle = data["handle"]
+        payload, data = data, resolve_summary(data)
+        survey = registry.get(year)
+        name_sumvar = survey.metadata.column_names_to_labels[sumvar]
+        chart = {
+            "y": "Recuento" if "Recuento" in data.columns else sumvar,
+            "title": f"{name_sumvar} ({period}, {weights})",
+            "max_facets": max_facets(),
+        }
+        if ERROR_COLUMNS[0] in data.columns:
+            chart["error"] = ERROR_COLUMNS[0]
+        if payload.get("collapse"):
+            with phase("aggregate"):
+                collapsed = chart_summary(payload, data, chart["y"])
+            with phase("serialize"):
+                chart["records"] = frame_records(collapsed)
+            chart["title"] += f" · resto agrupado en «{OTHERS}»"
         dtypes = ["text" if i == "object" else "numeric" for i in data.dtypes]
         column_formats = [
             {
-                "name": survey.metadata.column_names_to_labels[i],
+                "name": survey.metadata.column_names_to_labels.get(i, i),
                 "id": i,
                 "type": d,
                 "format": Format(precision=4, scheme=Scheme.fixed, trim=Trim.yes).group(
@@ -667,20 +1045,45 @@ def create_table_and_chart(
             }
             for i, d in zip(data.columns, dtypes)
         ]
-        table = DataTable(
-            id="dash-table",
-            data=data.to_dict("records"),
-            columns=column_formats,
-            sort_action="native",
-            filter_action="native",
-            page_action="native",
-            page_size=50,
-            export_format="csv",
+        with phase("serialize"):
+            records = frame_records(data)
+        with phase("render"):
+            table = DataTable(
+                id="dash-table",
+                data=records,
+                columns=column_formats,
+                sort_action="native",
+                filter_action="native",
+                page_action="native",
+                page_size=50,
+                export_format="csv",
+            )
+        downloads = html.Div(
+            [
+                dbc.Button(
+                    label,
+                    href=f"/export/{handle}.{fmt}",
+                    external_link=True,
+                    size="sm",
+                    color="secondary",
+                    outline=True,
+                    class_name="me-2",
+                )
+                for label, fmt in (("Descargar CSV", "csv"), ("Descargar Parquet", "parquet"))
+            ],
+            class_name="mb-2",
         )
-        return table, dcc.Graph(figure=plot, id="chart")
+        return [downloads, table], chart
     else:
         return None, None
 
 
+metrics.instrument(app)
+init_compression(server)
+server.register_blueprint(api.create_blueprint(registry, get_summary))
+server.register_blueprint(export.create_blueprint(registry, result_store.get))
+lazy.warm_up()
+
+
 if __name__ == "__main__":
     app.run_server(debug=True, host="0.0.0.0", port=8080)
@@ -0,0 +1,228 @@
+// Clientside callbacks for the results chart. The server only sends the summary table
+// once; choosing axes, colours and facets re-renders the figure in the browser.
+(function () {
+    "use strict";
+
+    var FACET_COL_SPACING = 0.03;
+    var FACET_ROW_SPACING = 0.07;
+
+    function unique(values) {
+        var seen = new Set();
+        var result = [];
+        values.forEach(function (value) {
+            if (!seen.has(value)) {
+                seen.add(value);
+                result.push(value);
+            }
+        });
+        return result;
+    }
+
+    function isNumeric(values) {
+        return values.length > 0 && values.every(function (value) {
+            return typeof value === "number" || value === null;
+        });
+    }
+
+    function colorscale(colors) {
+        return colors.map(function (color, i) {
+            return [colors.length > 1 ? i / (colors.length - 1) : 0, color];
+        });
+    }
+
+    function axisName(kind, index) {
+        return kind + (index > 1 ? index : "");
+    }
+
+    function facetGrid(colValues, rowValues, hasRowLabels) {
+        var ncols = colValues.length;
+        var nrows = rowValues.length;
+        var right = hasRowLabels ? 0.97 : 1;
+        var width = (right - FACET_COL_SPACING * (ncols - 1)) / ncols;
+        var height = (1 - FACET_ROW_SPACING * (nrows - 1)) / nrows;
+        var cells = [];
+        rowValues.forEach(function (rowValue, r) {
+            colValues.forEach(function (colValue, c) {
+                var index = r * ncols + c + 1;
+                var x0 = c * (width + FACET_COL_SPACING);
+                var y1 = 1 - r * (height + FACET_ROW_SPACING);
+                cells.push({
+                    row: rowValue,
+                    col: colValue,
+                    index: index,
+                    xdomain: [x0, x0 + width],
+                    ydomain: [y1 - height, y1],
+                    bottom: r === nrows - 1,
+                    left: c === 0,
+                });
+            });
+        });
+        return cells;
+    }
+
+    function barFigure(records, chart, x, color, facetCol, facetRow, settings) {
+        if (!records || !chart) {
+            return {data: [], layout: {template: settings ? settings.template : undefined}};
+        }
+        var y = chart.y;
+        // Collapsed copy of the summary when it has too many groups to draw.
+        var rows = (chart.records || records).map(function (record, i) {
+            return Object.assign({__index: i}, record);
+        });
+        var xKey = x || "__index";
+        var colValues = facetCol ? unique(rows.map(function (r) { return r[facetCol]; })) : [null];
+        var rowValues = facetRow ? unique(rows.map(function (r) { return r[facetRow]; })) : [null];
+        if (chart.max_facets) {
+            // Facets beyond the cap are left out of the grid.
+            colValues = colValues.slice(0, chart.max_facets);
+            rowValues = rowValues.slice(0, Math.max(1, Math.floor(chart.max_facets / colValues.length)));
+        }
+        var colorValues = color ? rows.map(function (r) { return r[color]; }) : [];
+        var continuous = color && isNumeric(colorValues);
+        var groups = color && !continuous ? unique(colorValues) : [null];
+        var colorway = settings.colorway;
+        var cells = facetGrid(colValues, rowValues, Boolean(facetRow));
+        var data = [];
+        var layout = {
+            template: settings.template,
+            title: {text: chart.title},
+            barmode: "group",
+            legend: {title: {text: color || ""}, tracegroupgap: 0},
+            annotations: [],
+        };
+        if (continuous) {
+            layout.coloraxis = {
+                colorscale: colorscale(settings.colorscale),
+                colorbar: {title: {text: color}},
+            };
+        }
+        cells.forEach(function (cell) {
+            var xaxis = axisName("xaxis", cell.index);
+            var yaxis = axisName("yaxis", cell.index);
+            layout[xaxis] = {
+                domain: cell.xdomain,
+                anchor: axisName("y", cell.index),
+                title: {text: cell.bottom ? x || "index" : ""},
+                showticklabels: cell.bottom,
+            };
+            layout[yaxis] = {
+                domain: cell.ydomain,
+                anchor: axisName("x", cell.index),
+                title: {text: cell.left ? y : ""},
+                showticklabels: cell.left,
+            };
+            if (cell.index > 1) {
+                layout[xaxis].matches = "x";
+                layout[yaxis].matches = "y";
+            }
+            var inCell = rows.filter(function (r) {
+                return (!facetCol || r[facetCol] === cell.col) && (!facetRow || r[facetRow] === cell.row);
+            });
+            groups.forEach(function (group, g) {
+                var members = color && !continuous ? inCell.filter(function (r) { return r[color] === group; }) : inCell;
+                var trace = {
+                    type: "bar",
+                    x: members.map(function (r) { return r[xKey]; }),
+                    y: members.map(function (r) { return r[y]; }),
+                    xaxis: axisName("x", cell.index),
+                    yaxis: axisName("y", cell.index),
+                    hovertemplate: (x || "index") + "=%{x}<br>" + y + "=%{y}<extra></extra>",
+                    showlegend: false,
+                };
+                if (chart.error) {
+                    trace.error_y = {
+                        type: "data",
+                        array: members.map(function (r) { return r[chart.error]; }),
+                        visible: true,
+                    };
+                }
+                if (continuous) {
+                    trace.marker = {color: members.map(function (r) { return r[color]; }), coloraxis: "coloraxis"};
+                } else if (color) {
+                    trace.name = String(group);
+                    trace.legendgroup = String(group);
+                    trace.showlegend = cell.index === 1;
+                    trace.offsetgroup = String(group);
+                    trace.marker = {color: colorway[g % colorway.length]};
+                    trace.hovertemplate = color + "=" + group + "<br>" + trace.hovertemplate;
+                } else {
+                    trace.marker = {color: colorway[0]};
+                }
+                data.push(trace);
+            });
+            if (facetCol) {
+                layout.annotations.push({
+                    text: facetCol + "=" + cell.col,
+                    x: (cell.xdomain[0] + cell.xdomain[1]) / 2,
+                    y: cell.ydomain[1],
+                    xref: "paper",
+                    yref: "paper",
+                    xanchor: "center",
+                    yanchor: "bottom",
+                    showarrow: false,
+                });
+            }
+            if (facetRow && cell.col === colValues[colValues.length - 1]) {
+                layout.annotations.push({
+                    text: facetRow + "=" + cell.row,
+                    x: cell.xdomain[1],
+                    y: (cell.ydomain[0] + cell.ydomain[1]) / 2,
+                    xref: "paper",
+                    yref: "paper",
+                    xanchor: "left",
+                    yanchor: "middle",
+                    textangle: 90,
+                    showarrow: false,
+                });
+            }
+        });
+        return {data: data, layout: layout};
+    }
+
+    function validateValues(data, x, color, facetCol, facetRow, sumvar) {
+        if (!data) {
+            throw window.dash_clientside.PreventUpdate;
+        }
+        var columns = data.columns;
+        var values = [x, color, facetCol, facetRow].map(function (value) {
+            return columns.indexOf(value) >= 0 ? value : null;
+        });
+        if (columns.indexOf("Recuento") >= 0) {
+            values[0] = sumvar;
+        } else if (data.years && values.every(function (value) { return value === null; })) {
+            values[0] = "anio";
+        }
+        return values;
+    }
+
+    function controlOptions(by, data, sumvar) {
+        if (!data) {
+            throw window.dash_clientside.PreventUpdate;
+        }
+        var labels = data.labels || {};
+        var groupers = (by || []).slice();
+        if (data.years && groupers.indexOf("anio") < 0) {
+            groupers.unshift("anio");
+        }
+        var options = groupers.map(function (value) {
+            return {label: labels[value] || value, value: value};
+        });
+        if (data.columns.indexOf("Recuento") >= 0) {
+            return [[{label: labels[sumvar] || sumvar, value: sumvar}], options, options, options];
+        }
+        return [options, options, options, options];
+    }
+
+    var charts = {
+        bar_figure: barFigure,
+        validate_values: validateValues,
+        control_options: controlOptions,
+    };
+
+    if (typeof window !== "undefined") {
+        window.dash_clientside = Object.assign({}, window.dash_clientside, {charts: charts});
+    }
+    if (typeof module !== "undefined") {
+        module.exports = charts;
+    }
+})();
@@ -0,0 +1,358 @@
+"""Offline benchmark suite over a synthetic survey.
+
+    python -m benchmarks.run [--households N] [--output results.json] [--baseline old.json]
+
+Times the survey cache round trip, engine summaries over representative groupings,
+dictionary search, record serialization and the Dash callbacks invoked directly. Results
+are written as JSON; with `--baseline`, medians are compared and the run fails when any
+benchmark is slower than `--threshold` times its baseline.
+"""
+import argparse
+import gzip
+import inspect
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict
+
+# Keep the on-disk caches of the run away from the real ones.
+WORKDIR = tempfile.mkdtemp(prefix="pyech-bench-")
+os.environ["PYECH_CACHE_DIR"] = os.path.join(WORKDIR, "cache")
+os.environ.pop("PYECH_RESULT_CACHE_DIR", None)
+os.environ.pop("PYECH_RESULT_STORE_DIR", None)
+
+import numpy as np
+import orjson
+import pandas as pd
+
+from benchmarks.synthetic import make_survey
+from bitmaps import Filter
+from cache import SurveyCache
+from dictionary import DictionaryIndex
+from engine import AggregationEngine
+from households import Households
+from results import ResultStore, SummaryCache, frame_records
+
+
+YEAR = 2019
+FILTERS = {
+    "value": Filter.create({"conditions": [{"variable": "dpto", "values": [1]}]}),
+    "and-range": Filter.create(
+        {
+            "conditions": [
+                {"variable": "pobpcoac", "values": [2, 3, 4]},
+                {"variable": "e27", "low": 14, "high": 65},
+            ]
+        }
+    ),
+    "or": Filter.create(
+        {
+            "conditions": [
+                {"variable": "dpto", "values": [1]},
+                {"variable": "region_4", "values": [4]},
+            ],
+            "any": True,
+        }
+    ),
+}
+GROUPINGS = [[], ["dpto"], ["e26", "dpto"], ["region_4", "e26"], ["dpto", "e26", "pobpcoac"]]
+TERMS = ["ingreso", "ho", "departamento", "sexo", "material de"]
+
+
+def measure(func: Callable, repeat: int, setup: Callable = None) -> Dict[str, float]:
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "repeat": repeat,
+    }
+
+
+class Suite:
+    def __init__(self, repeat: int):
+        self.repeat = repeat
+        self.results: Dict[str, Dict[str, float]] = {}
+
+    def run(self, name: str, func: Callable, repeat: int = None, setup: Callable = None):
+        self.results[name] = measure(func, repeat or self.repeat, setup)
+        print(f"{name:<60} {self.results[name]['median'] * 1000:>10.2f} ms", flush=True)
+
+
+def bench_load(suite: Suite, survey):
+    cache = SurveyCache()
+    suite.run("load/write", lambda: cache.write(YEAR, survey), repeat=3)
+    suite.run("load/read", lambda: cache.read(YEAR, lazy=False))
+    suite.run("load/read_lazy", lambda: cache.read(YEAR, lazy=True))
+
+    def first_query():
+        lazy = cache.read(YEAR, lazy=True)
+        engine = AggregationEngine(lazy, precompute=False)
+        engine.summarize("ht11", ["dpto"], aggfunc="mean", weights="pesoano")
+
+    suite.run("load/first_query_lazy", first_query, repeat=3)
+    mapped = cache.read(YEAR, lazy=False)
+    suite.run("load/households", lambda: Households.build(mapped.data), repeat=3)
+    suite.run("load/engine", lambda: AggregationEngine(mapped), repeat=3)
+    suite.run("load/dictionary_index", lambda: DictionaryIndex(mapped.dictionary), repeat=3)
+
+
+def bench_summarize(suite: Suite, engine: AggregationEngine):
+    for by in GROUPINGS:
+        grouping = "+".join(by) or "total"
+        for household_level in (False, True):
+            level = "hogares" if household_level else "personas"
+            for variable, aggfunc, is_categorical in (
+                ("ht11", "mean", False),
+                ("pobpcoac", "count", True),
+            ):
+                for errors in (False, True):
+                    suffix = "/errors" if errors else ""
+                    suite.run(
+                        f"summarize/{variable}-{aggfunc}/{grouping}/{level}{suffix}",
+                        lambda: engine.summarize(
+                            variable,
+                            by,
+                            aggfunc=aggfunc,
+                            is_categorical=is_categorical,
+                            household_level=household_level,
+                            weights="pesoano",
+                            errors=errors,
+                        ),
+                        setup=engine.clear_rollups,
+                    )
+    for name, where in FILTERS.items():
+        suite.run(
+            f"summarize/ht11-mean/dpto/personas/where-{name}",
+            lambda: engine.summarize(
+                "ht11", ["dpto"], aggfunc="mean", weights="pesoano", where=where
+            ),
+            setup=engine.clear_rollups,
+        )
+        suite.run(f"filter/mask/{name}", lambda: engine.mask(where))
+
+
+def bench_rollup(suite: Suite, engine: AggregationEngine):
+    finest = ["dpto", "e26", "pobpcoac"]
+
+    for variable in ("ht19", "ht11"):
+
+        def drill_down():
+            engine.clear_rollups()
+            engine.summarize(variable, finest, aggfunc="mean", weights="pesoano")
+
+        for by in (["e26", "pobpcoac", "dpto"], ["dpto", "e26"], ["dpto"], []):
+            grouping = "+".join(by) or "total"
+            summarize = lambda: engine.summarize(
+                variable, by, aggfunc="mean", weights="pesoano"
+            )
+            suite.run(
+                f"summarize/rollup/{variable}-mean/{grouping}", summarize, setup=drill_down
+            )
+            drill_down()
+            rolled_up = summarize()
+            engine.clear_rollups()
+            # Roll-ups must give the engine's own direct result, bit for bit.
+            pd.testing.assert_frame_equal(rolled_up, summarize(), check_exact=True)
+
+
+def bench_dictionary(suite: Suite, index: DictionaryIndex):
+    def search(term):
+        index._prefix_rows.cache_clear()
+        return index.search(term)
+
+    for term in TERMS:
+        suite.run(f"dictionary/search/{term}", lambda: search(term))
+
+
+def bench_serialization(suite: Suite, survey, engine: AggregationEngine):
+    import plotly
+
+    summary = engine.summarize(
+        "ht11", ["dpto", "e26", "pobpcoac"], aggfunc="mean", weights="pesoano"
+    )
+    rows = survey.data.iloc[:10_000, :20]
+    for name, frame in (("summary", summary), ("microdata", rows)):
+        suite.run(f"serialize/{name}/to_dict", lambda: frame.to_dict("records"))
+        records = frame.to_dict("records")
+        suite.run(
+            f"serialize/{name}/json",
+            lambda: json.dumps(records, cls=plotly.utils.PlotlyJSONEncoder),
+        )
+        suite.run(f"serialize/{name}/frame_records", lambda: frame_records(frame))
+        suite.run(
+            f"serialize/{name}/gzip",
+            lambda: gzip.compress(orjson.dumps(frame_records(frame)), 5),
+        )
+
+
+def bench_callbacks(suite: Suite, survey):
+    import flask
+
+    import app
+
+    app.registry.put(
+        YEAR,
+        survey,
+        {
+            "engine": AggregationEngine(survey),
+            "dictionary_index": DictionaryIndex(survey.dictionary),
+        },
+    )
+
+    def call(callback, triggered: str, *args):
+        func = inspect.unwrap(callback)
+        with app.server.test_request_context():
+            flask.g.triggered_inputs = [{"prop_id": triggered, "value": None}]
+            return func(*args)
+
+    def reset_caches():
+        app.summary_cache = SummaryCache()
+        app.result_store = ResultStore()
+        # Otherwise "cold" runs after the first roll up the partials the first one kept.
+        app.registry.peek(YEAR, "engine").clear_rollups()
+
+    suite.run(
+        "callbacks/set_survey_year_and_weights_and_create_dictionary",
+        lambda: call(
+            app.set_survey_year_and_weights_and_create_dictionary,
+            "year.value",
+            YEAR,
+            "pesoano",
+            0,
+        ),
+    )
+    suite.run(
+        "callbacks/filter_dictionary",
+        lambda: call(
+            app.filter_dictionary,
+            "dictionary-search.value",
+            0,
+            50,
+            [],
+            "",
+            "ingreso",
+            YEAR,
+        ),
+    )
+    summarize_args = (
+        "ht11",
+        ["dpto", "e26"],
+        "mean",
+        "False",
+        "False",
+        "pesoano",
+        [],
+        [2007, 2020],
+        [],
+        [],
+        "all",
+        YEAR,
+    )
+    suite.run(
+        "callbacks/summarize/cold",
+        lambda: call(app.summarize, "sumvar.value", *summarize_args),
+        setup=reset_caches,
+    )
+    suite.run(
+        "callbacks/summarize/cached",
+        lambda: call(app.summarize, "sumvar.value", *summarize_args),
+    )
+    payload, _, _ = call(app.summarize, "sumvar.value", *summarize_args)
+    suite.run(
+        "callbacks/create_table",
+        lambda: call(app.create_table, "sum-data.data", payload, "ht11", "pesoano", YEAR),
+    )
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """Print median ratios against `baseline` and return whether any exceeds `threshold`."""
+    regressed = False
+    print(f"\n{'benchmark':<60} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        ratio = current["median"] / previous["median"] if previous["median"] else float("inf")
+        flag = " REGRESSION" if ratio > threshold else ""
+        regressed |= bool(flag)
+        print(
+            f"{name:<60} {previous['median'] * 1000:>8.2f}ms "
+            f"{current['median'] * 1000:>8.2f}ms {ratio:>6.2f}x{flag}"
+        )
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite.")
+    parser.add_argument("--households", type=int, default=45_000)
+    parser.add_argument("--extra-columns", type=int, default=400)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--output", default="benchmarks/results.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    parser.add_argument(
+        "--only", nargs="*", default=["load", "summarize", "dictionary", "serialize", "callbacks"]
+    )
+    args = parser.parse_args()
+
+    survey = make_survey(YEAR, args.households, args.extra_columns)
+    suite = Suite(args.repeat)
+    if "load" in args.only:
+        bench_load(suite, survey)
+    engine = AggregationEngine(survey)
+    if "summarize" in args.only:
+        bench_summarize(suite, engine)
+        bench_rollup(suite, engine)
+    if "dictionary" in args.only:
+        bench_dictionary(suite, DictionaryIndex(survey.dictionary))
+    if "serialize" in args.only:
+        bench_serialization(suite, survey, engine)
+    if "callbacks" in args.only:
+        bench_callbacks(suite, survey)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "persons": len(survey.data),
+            "columns": len(survey.data.columns),
+            "households": args.households,
+        },
+        "results": suite.results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        if compare(suite.results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
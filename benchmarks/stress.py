@@ -0,0 +1,161 @@
+"""Concurrency stress test of survey access.
+
+    python -m benchmarks.stress [--households N] [--threads 8] [--seconds 10] [--evict]
+
+Reader threads summarize one year with randomly chosen weights and groupings, the way
+concurrent sessions do, while a writer thread keeps swapping the year between two
+different surveys, with and without prebuilt engines, as reloads do. With `--evict`, the
+writer also inserts another year under a budget that fits only one, so the summarized
+year keeps being evicted and loaded again. Every result is compared with the one computed
+sequentially for the survey and weights its view was taken with, and every engine must be
+the one built from its view's survey; the run fails on any mismatch or error.
+"""
+import argparse
+import copy
+import itertools
+import random
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from benchmarks.synthetic import make_survey
+from engine import AggregationEngine
+from registry import SurveyRegistry
+
+
+YEAR = 2019
+OTHER_YEAR = 2020
+WEIGHTS = ["pesoano", "pesomen"]
+SPECS = [
+    ("ht11", ("dpto",), "mean", False),
+    ("pt1", ("e26", "region_4"), "sum", False),
+    ("e27", (), "mean", True),
+    ("pobpcoac", ("e26",), "count", False),
+]
+COPIES = 2
+
+
+def summarize(view, sumvar, by, aggfunc, household_level):
+    engine = view.derived("engine")
+    if engine.data is not view.survey.data:
+        raise AssertionError("The view paired its survey with another survey's engine.")
+    return engine.summarize(
+        sumvar,
+        by,
+        aggfunc=aggfunc,
+        household_level=household_level,
+        weights=view.weights,
+    )
+
+
+def run(
+    households: int, extra_columns: int, threads: int, seconds: float, evict: bool = False
+) -> Tuple[Dict[str, int], List[str]]:
+    """Counts of what happened during the run and the tracebacks of its failures."""
+    # Two surveys with different data, each in several copies with their own frame so
+    # every swap installs new objects, and the seed each copy was made from.
+    seeds = {}
+    surveys = []
+    for seed in (0, 1):
+        base = make_survey(YEAR, households, extra_columns, seed=seed)
+        for _ in range(COPIES):
+            survey = copy.copy(base)
+            survey.data = base.data.copy(deep=False)
+            seeds[id(survey)] = seed
+            surveys.append(survey)
+
+    expected = {}
+    for seed in (0, 1):
+        survey = next(s for s in surveys if seeds[id(s)] == seed)
+        engine = AggregationEngine(survey)
+        for weights in WEIGHTS:
+            for spec in SPECS:
+                expected[seed, weights, spec] = engine.summarize(
+                    spec[0], spec[1], aggfunc=spec[2], household_level=spec[3], weights=weights
+                )
+    engines = {id(s): AggregationEngine(s) for s in surveys}
+
+    loads = itertools.cycle(surveys)
+    registry = SurveyRegistry(
+        loader=lambda year, progress=None: next(loads), memory_budget=1 if evict else None
+    )
+    registry.register("engine", AggregationEngine)
+    registry.put(YEAR, surveys[0], {"engine": engines[id(surveys[0])]})
+
+    stop = threading.Event()
+    failures = []
+    counts = {"summaries": 0, "swaps": 0}
+    lock = threading.Lock()
+
+    def reader(rng: random.Random):
+        while not stop.is_set():
+            weights = rng.choice(WEIGHTS)
+            spec = rng.choice(SPECS)
+            try:
+                view = registry.view(YEAR, weights)
+                result = summarize(view, *spec)
+                pd.testing.assert_frame_equal(
+                    result, expected[seeds[id(view.survey)], weights, spec], check_exact=True
+                )
+            except Exception:
+                with lock:
+                    failures.append(traceback.format_exc())
+                stop.set()
+                return
+            with lock:
+                counts["summaries"] += 1
+
+    def writer(rng: random.Random):
+        while not stop.is_set():
+            survey = rng.choice(surveys)
+            # Half of the swaps leave the engine to be built by the first reader.
+            derived = {"engine": engines[id(survey)]} if rng.random() < 0.5 else {}
+            year = OTHER_YEAR if evict and rng.random() < 0.3 else YEAR
+            registry.put(year, survey, derived)
+            counts["swaps"] += 1
+            time.sleep(rng.uniform(0, 0.01))
+
+    workers = [
+        threading.Thread(target=reader, args=(random.Random(i),), daemon=True)
+        for i in range(threads)
+    ]
+    workers.append(threading.Thread(target=writer, args=(random.Random(-1),), daemon=True))
+    for worker in workers:
+        worker.start()
+    stop.wait(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    counts["evictions"] = registry.evictions
+    counts["loads"] = registry.misses
+    return counts, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress concurrent survey access.")
+    parser.add_argument("--households", type=int, default=5_000)
+    parser.add_argument("--extra-columns", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--evict", action="store_true")
+    args = parser.parse_args()
+
+    counts, failures = run(
+        args.households, args.extra_columns, args.threads, args.seconds, args.evict
+    )
+    print(
+        f"{counts['summaries']} summaries across {counts['swaps']} swaps, "
+        f"{counts['evictions']} evictions and {counts['loads']} loads"
+    )
+    if failures:
+        print(failures[0], file=sys.stderr)
+        print(f"{len(failures)} failures", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Synthetic ECH-shaped surveys for offline benchmarks.
+
+Households of one to eight people with one row per person and household variables
+repeated on every member, `pesoano`/`pesomen` weights, labelled categorical variables
+with ECH-like cardinalities and filler numeric columns up to a realistic width. Like in
+the ECH, some variables only apply to part of the population: a `missing` share of the
+values of `MISSING` is left empty.
+"""
+import string
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from pyech import ECH
+
+
+DEFAULT_HOUSEHOLDS = 45_000
+DEFAULT_EXTRA_COLUMNS = 400
+HOUSEHOLD_SIZES = np.arange(1, 9)
+HOUSEHOLD_SIZE_P = np.array([0.22, 0.28, 0.2, 0.16, 0.08, 0.03, 0.02, 0.01])
+
+DEPARTMENTS = [
+    "Montevideo", "Artigas", "Canelones", "Cerro Largo", "Colonia", "Durazno",
+    "Flores", "Florida", "Lavalleja", "Maldonado", "Paysandú", "Río Negro", "Rivera",
+    "Rocha", "Salto", "San José", "Soriano", "Tacuarembó", "Treinta y Tres",
+]
+# name: (label, value labels, household-level)
+CATEGORICAL = {
+    "dpto": ("Departamento", dict(enumerate(DEPARTMENTS, 1)), True),
+    "region_4": (
+        "Región",
+        {1: "Montevideo", 2: "Interior > 5000", 3: "Interior < 5000", 4: "Rural"},
+        True,
+    ),
+    "e26": ("Sexo", {1: "Hombre", 2: "Mujer"}, False),
+    "pobpcoac": (
+        "Condición de actividad",
+        {i: f"Condición {i}" for i in range(1, 12)},
+        False,
+    ),
+    "e49": ("Asiste a un centro educativo", {1: "Sí", 2: "No"}, False),
+    "c2": (
+        "Material de las paredes",
+        {i: f"Material {i}" for i in range(1, 7)},
+        True,
+    ),
+}
+# Variables with missing values, as questions asked only of some people or households.
+MISSING = ("e49", "c2", "pt1")
+DEFAULT_MISSING = 0.05
+NUMERIC = {
+    "e27": ("Edad", False),
+    "pt1": ("Ingreso personal", False),
+    "ht11": ("Ingreso del hogar", True),
+    "ht19": ("Cantidad de integrantes", True),
+}
+
+
+def _word(rng: np.random.Generator, length: int = 8) -> str:
+    return "".join(rng.choice(list(string.ascii_lowercase), size=length))
+
+
+def make_survey(
+    year: int = 2019,
+    households: int = DEFAULT_HOUSEHOLDS,
+    extra_columns: int = DEFAULT_EXTRA_COLUMNS,
+    seed: int = 0,
+    missing: float = DEFAULT_MISSING,
+) -> ECH:
+    rng = np.random.default_rng(seed)
+    sizes = rng.choice(HOUSEHOLD_SIZES, size=households, p=HOUSEHOLD_SIZE_P)
+    household = np.repeat(np.arange(households), sizes)
+    starts = np.repeat(np.cumsum(sizes) - sizes, sizes)
+    persons = len(household)
+    columns = {
+        "anio": np.full(persons, year, dtype=np.int64),
+        "numero": (household + year * 1_000_000).astype(np.float64),
+        "nper": (np.arange(persons) - starts + 1).astype(np.float64),
+    }
+    pesoano = rng.gamma(2.0, 40.0, size=households).round()
+    columns["pesoano"] = pesoano[household]
+    columns["pesomen"] = (pesoano * rng.uniform(10, 14, size=households)).round()[household]
+    for name, (_, labels, household_level) in CATEGORICAL.items():
+        codes = np.array(list(labels))
+        p = rng.dirichlet(np.ones(len(codes)))
+        values = rng.choice(codes, size=households if household_level else persons, p=p)
+        columns[name] = (values[household] if household_level else values).astype(np.float64)
+    columns["e27"] = rng.integers(0, 100, size=persons).astype(np.float64)
+    columns["pt1"] = rng.lognormal(10, 1, size=persons).round(2)
+    columns["ht11"] = rng.lognormal(11, 0.8, size=households).round(2)[household]
+    columns["ht19"] = sizes[household].astype(np.float64)
+    for name in MISSING:
+        household_level = CATEGORICAL.get(name, NUMERIC.get(name))[-1]
+        if household_level:
+            empty = (rng.random(households) < missing)[household]
+        else:
+            empty = rng.random(persons) < missing
+        columns[name][empty] = np.nan
+    extra_labels = {}
+    for i in range(extra_columns):
+        name = f"v{i:03d}"
+        if i % 2:
+            values = rng.integers(1, 3 + i % 20, size=persons).astype(np.float64)
+            values[rng.random(persons) < 0.05] = np.nan
+            extra_labels[name] = {code: f"{_word(rng)} {code}" for code in np.unique(values[~np.isnan(values)])}
+        else:
+            values = rng.normal(100, 30, size=persons).round(1)
+        columns[name] = values
+    data = pd.DataFrame(columns)
+
+    labels = {name: label for name, (label, _, _) in CATEGORICAL.items()}
+    labels.update({name: label for name, (label, _) in NUMERIC.items()})
+    labels.update({"anio": "Año", "numero": "Identificador del hogar", "nper": "Número de persona"})
+    labels.update({"pesoano": "Ponderador anual", "pesomen": "Ponderador mensual"})
+    labels.update({name: f"Variable {name} {_word(rng)}" for name in data.columns if name not in labels})
+    value_labels = {name: labels_ for name, (_, labels_, _) in CATEGORICAL.items()}
+    value_labels.update(extra_labels)
+
+    survey = ECH()
+    survey.data = data
+    survey.metadata = SimpleNamespace(
+        column_names=list(data.columns),
+        column_labels=[labels[c] for c in data.columns],
+        column_names_to_labels=labels,
+        column_labels_and_names={c: f"{c} - {labels[c]}" for c in data.columns},
+        variable_value_labels=value_labels,
+    )
+    survey.dictionary = pd.DataFrame(
+        {
+            "Nombre": list(data.columns),
+            "Descripción": [labels[c] for c in data.columns],
+            "Opciones": [
+                ", ".join(f"{k}: {v}" for k, v in value_labels.get(c, {}).items()) or None
+                for c in data.columns
+            ],
+        }
+    )
+    survey.weights = None
+    return survey
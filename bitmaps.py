@@ -0,0 +1,178 @@
+"""Per-value bitmap indexes for restricting summaries to a subpopulation.
+
+For every categorical column, one bitmap per distinct value marks the rows holding it,
+packed eight rows to a byte with `np.packbits`. A `Filter` is evaluated with bitwise
+and/or over those bitmaps into a boolean row mask that the engine applies to its group
+codes, so a restricted summary never copies or scans `survey.data`. Ranges over numeric
+columns, such as ages, fall back to comparing the column's values, and columns with more
+distinct values than `max_values()` to comparing their codes, since their bitmaps would
+take more memory than they save time.
+
+A lazily loaded survey indexes only `indexed_columns()` when it loads, so the rest of its
+columns stay unread; any other column is indexed the first time a filter uses it.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from functools import reduce
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+
+DEFAULT_INDEXED_COLUMNS = ["dpto", "region_4", "e26", "pobpcoac"]
+DEFAULT_MAX_VALUES = 256
+
+
+def indexed_columns() -> List[str]:
+    columns = json.loads(os.environ.get("PYECH_BITMAP_COLUMNS", "null"))
+    return DEFAULT_INDEXED_COLUMNS if columns is None else columns
+
+
+def max_values() -> int:
+    return int(os.environ.get("PYECH_BITMAP_MAX_VALUES", DEFAULT_MAX_VALUES))
+
+
+class Condition(NamedTuple):
+    """Rows whose `variable` is one of `values`, or else lies between `low` and `high`."""
+
+    variable: str
+    values: Tuple = ()
+    low: Optional[float] = None
+    high: Optional[float] = None
+
+    @classmethod
+    def create(cls, item) -> "Condition":
+        if isinstance(item, dict):
+            item = [item.get(k) for k in cls._fields]
+        variable, values, low, high = (list(item) + [None] * 4)[:4]
+        if not variable:
+            raise ValueError("A condition needs a variable.")
+        values = tuple(values or ())
+        if not values and low is None and high is None:
+            raise ValueError(f"The condition on {variable} needs values or a range.")
+        return cls(variable, values, low, high)
+
+
+class Filter(NamedTuple):
+    """Conditions combined with and, or with or when `disjunction` is set."""
+
+    conditions: Tuple[Condition, ...]
+    disjunction: bool = False
+
+    @classmethod
+    def create(cls, value) -> Optional["Filter"]:
+        """Filter from ``{"conditions": [...], "any": bool}`` or its tuple form; None if empty."""
+        if not value:
+            return None
+        if isinstance(value, dict):
+            conditions, disjunction = value.get("conditions"), value.get("any", False)
+        else:
+            conditions, disjunction = (list(value) + [False])[:2]
+        if not conditions:
+            return None
+        return cls(tuple(Condition.create(c) for c in conditions), bool(disjunction))
+
+    @property
+    def variables(self) -> Tuple[str, ...]:
+        return tuple(dict.fromkeys(c.variable for c in self.conditions))
+
+
+class BitmapIndex:
+    """Bitmaps of the values of every categorical column of an `AggregationEngine`'s survey.
+
+    They are built as part of the survey load, for every column with `precompute` and
+    for `indexed_columns()` otherwise; the rest are built the first time a filter uses
+    them. Bitmaps built after the load are reported to the engine, which charges them to
+    the registry holding it.
+    """
+
+    def __init__(self, engine, precompute: bool = True):
+        self.engine = engine
+        self.length = len(engine.data)
+        self.max_values = max_values()
+        self._bitmaps: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        columns = engine.data.columns if precompute else indexed_columns()
+        for column in columns:
+            if column in engine.data.columns and self.indexed(column):
+                self.bitmaps(column)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(b.nbytes for b in list(self._bitmaps.values()))
+
+    def indexed(self, column: str) -> bool:
+        """Whether `column` is categorical with few enough values to have bitmaps."""
+        return (
+            self.engine.is_categorical(column) and self.engine.distinct(column) <= self.max_values
+        )
+
+    def bitmaps(self, column: str) -> np.ndarray:
+        """Packed bitmaps of `column`, one row per value in the order of its codes."""
+        bitmaps = self._bitmaps.get(column)
+        if bitmaps is None:
+            codes = self.engine.codes(column)
+            built = np.empty((len(codes.uniques), (self.length + 7) // 8), dtype=np.uint8)
+            for i in range(len(codes.uniques)):
+                built[i] = np.packbits(codes.codes == i)
+            with self._lock:
+                bitmaps = self._bitmaps.setdefault(column, built)
+            if bitmaps is built:
+                self.engine.grew(built.nbytes)
+        return bitmaps
+
+    def condition(self, condition: Condition) -> np.ndarray:
+        """Packed bitmap of the rows matching `condition`."""
+        column = condition.variable
+        if column not in self.engine.data.columns:
+            raise KeyError(f"Unknown filter variable: {column}")
+        if self.engine.is_categorical(column):
+            codes = self.engine.codes(column)
+            selected = np.flatnonzero(_matches(codes.uniques, condition))
+            if not self.indexed(column):
+                return np.packbits(np.isin(codes.codes, selected))
+            bitmaps = self.bitmaps(column)
+            if not len(selected):
+                return np.zeros(bitmaps.shape[1], dtype=np.uint8)
+            return np.bitwise_or.reduce(bitmaps[selected], axis=0)
+        values = self.engine.data[column] if condition.values else self.engine.values(column)
+        return np.packbits(_matches(np.asarray(values), condition))
+
+    def mask(self, where: Filter) -> np.ndarray:
+        """Boolean mask of the rows selected by `where`."""
+        combine = np.bitwise_or if where.disjunction else np.bitwise_and
+        bits = reduce(combine, (self.condition(c) for c in where.conditions))
+        return np.unpackbits(bits, count=self.length).astype(bool)
+
+
+def _matches(values: np.ndarray, condition: Condition) -> np.ndarray:
+    if condition.values:
+        return np.isin(values, _wanted(values, condition.values))
+    try:
+        values = values.astype(np.float64)
+    except (TypeError, ValueError):
+        raise ValueError(f"{condition.variable} is not numeric, filter it by values.")
+    matches = ~np.isnan(values)
+    if condition.low is not None:
+        matches &= values >= float(condition.low)
+    if condition.high is not None:
+        matches &= values <= float(condition.high)
+    return matches
+
+
+def _wanted(values: np.ndarray, wanted: Iterable) -> list:
+    # Values arrive through JSON, so numeric codes may come as strings.
+    if values.dtype.kind in "iuf":
+        return [float(v) for v in wanted if _is_number(v)]
+    return list(wanted)
+
+
+def _is_number(value) -> bool:
+    try:
+        float(value)
+    except (TypeError, ValueError):
+        return False
+    return True
@@ -0,0 +1,212 @@
+"""On-disk columnar cache of parsed ECH surveys.
+
+Each year is stored as uncompressed Arrow IPC files that are memory-mapped on read, so
+numeric columns are handed to pandas without copying. The cache directory is versioned
+by the installed pyech revision, which invalidates it whenever the pinned commit changes.
+
+Every gunicorn worker maps the same files, so each year's column arrays are loaded once
+per host and shared through the page cache. A file lock per year ensures that only one
+process downloads and writes a missing year while the others wait for it.
+
+Run ``python cache.py [YEAR ...]`` to pre-populate the cache (all years by default).
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import fcntl
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+from importlib import metadata as importlib_metadata
+from typing import Callable, TYPE_CHECKING
+
+import pandas as pd
+import pyarrow as pa
+
+import compact
+from columnstore import ColumnStore
+
+if TYPE_CHECKING:
+    from pyech import ECH
+
+DOWNLOADING = "downloading"
+PARSING = "parsing"
+
+CACHE_FORMAT_VERSION = 2
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+YEARS = range(2007, 2021)
+
+
+def pyech_revision() -> str:
+    try:
+        dist = importlib_metadata.distribution("pyech")
+    except importlib_metadata.PackageNotFoundError:
+        return "unknown"
+    direct_url = dist.read_text("direct_url.json")
+    if direct_url:
+        commit = json.loads(direct_url).get("vcs_info", {}).get("commit_id")
+        if commit:
+            return commit
+    return dist.version
+
+
+def survey_year(survey: ECH) -> int:
+    return int(survey.data["anio"].iloc[0])
+
+
+def fetch_survey(year: int) -> ECH:
+    from pyech import ECH
+
+    survey = ECH()
+    survey.load(year, from_repo=True)
+    return survey
+
+
+def frame_to_arrow(frame: pd.DataFrame) -> pa.Table:
+    arrays = []
+    for name in frame.columns:
+        column = frame[name]
+        if column.dtype.kind in "biuf":
+            # Keep NaN as a value instead of a validity bitmap so reads stay zero-copy.
+            arrays.append(pa.array(column.to_numpy(), from_pandas=False))
+        elif column.dtype == object:
+            # Labels of partially labelled variables mix str with codes; store them as text.
+            arrays.append(pa.array(column.astype("string"), type=pa.string(), from_pandas=True))
+        else:
+            arrays.append(pa.array(column, from_pandas=True))
+    return pa.Table.from_arrays(arrays, names=[str(name) for name in frame.columns])
+
+
+def write_arrow(frame: pd.DataFrame, path: str):
+    table = frame_to_arrow(frame)
+    tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def read_table(path: str) -> pa.Table:
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def read_arrow(path: str) -> pd.DataFrame:
+    return read_table(path).to_pandas(split_blocks=True)
+
+
+def lazy_columns() -> bool:
+    return os.environ.get("PYECH_LAZY_COLUMNS", "1") == "1"
+
+
+class SurveyCache:
+    data_file = "data.arrow"
+    dictionary_file = "dictionary.arrow"
+    state_file = "state.pkl"
+
+    def __init__(self, root: str = None):
+        root = root or os.environ.get("PYECH_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.root = os.path.join(
+            root, f"v{CACHE_FORMAT_VERSION}-{pyech_revision()[:12]}"
+        )
+
+    def path(self, year, name: str = "") -> str:
+        return os.path.join(self.root, str(int(year)), name)
+
+    def __contains__(self, year) -> bool:
+        # The state file is written last, so its presence marks a complete entry.
+        return os.path.exists(self.path(year, self.state_file))
+
+    def read(self, year, lazy: bool = None) -> ECH:
+        """Survey of `year`; with `lazy`, data columns are only read when first used."""
+        from pyech import ECH
+
+        lazy = lazy_columns() if lazy is None else lazy
+        with open(self.path(year, self.state_file), "rb") as f:
+            state = pickle.load(f)
+        survey = ECH()
+        vars(survey).update(state)
+        if lazy:
+            survey.data = ColumnStore.from_arrow(read_table(self.path(year, self.data_file)))
+        else:
+            survey.data = read_arrow(self.path(year, self.data_file))
+        survey.dictionary = read_arrow(self.path(year, self.dictionary_file))
+        return survey
+
+    def write(self, year, survey: ECH):
+        os.makedirs(self.path(year), exist_ok=True)
+        write_arrow(survey.data.reset_index(drop=True), self.path(year, self.data_file))
+        write_arrow(
+            survey.dictionary.reset_index(drop=True),
+            self.path(year, self.dictionary_file),
+        )
+        state = {
+            k: v for k, v in vars(survey).items() if k not in ("data", "dictionary")
+        }
+        # `weights` is a property stored as `_weights`; cached surveys carry none.
+        state["_weights"] = None
+        tmp_path = self.path(year, f"{self.state_file}.tmp{os.getpid()}")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path(year, self.state_file))
+
+    def compact_survey(self, year, survey: ECH):
+        if os.environ.get("PYECH_COMPACT", "1") != "1":
+            return
+        original = copy.copy(survey)
+        report = compact.compact(survey)
+        if os.environ.get("PYECH_VERIFY_COMPACTION") == "1":
+            compact.verify(original, survey)
+            report["verified"] = True
+        os.makedirs(self.path(year), exist_ok=True)
+        with open(self.path(year, "compaction.json"), "w") as f:
+            json.dump(report, f)
+
+    def load(
+        self, year, progress: Callable[[str], None] = None, lazy: bool = None
+    ) -> ECH:
+        progress = progress or (lambda status: None)
+        if year not in self:
+            os.makedirs(self.root, exist_ok=True)
+            with open(os.path.join(self.root, f"{int(year)}.lock"), "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    if year not in self:
+                        progress(DOWNLOADING)
+                        survey = fetch_survey(int(year))
+                        progress(PARSING)
+                        self.compact_survey(year, survey)
+                        self.write(year, survey)
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+        progress(PARSING)
+        # Always read back so the returned survey is backed by the memory-mapped files.
+        return self.read(year, lazy)
+
+    def clear(self, year=None):
+        path = self.path(year) if year is not None else self.root
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-populate the ECH survey cache.")
+    parser.add_argument("years", nargs="*", type=int, default=list(YEARS))
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument(
+        "--refresh", action="store_true", help="Discard cached entries first."
+    )
+    args = parser.parse_args()
+    cache = SurveyCache(args.cache_dir)
+    for year in args.years:
+        if args.refresh:
+            cache.clear(year)
+        start = time.perf_counter()
+        cache.load(year)
+        print(f"{year}: cached in {time.perf_counter() - start:.1f}s ({cache.path(year)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Bounded chart data for summaries grouped by high-cardinality variables.
+
+A grouping by localities or detailed occupation codes yields thousands of groups; drawn
+as bars, or worse as facets, they freeze the worker and the browser. Before a summary is
+aggregated, `collapse_limits` estimates how many groups each grouper contributes from the
+engine's distinct counts and decides how many values of each to keep. `collapse` then
+builds the chart's copy of the result with the remaining values merged into "Otros";
+the table and the downloads keep the full result.
+"""
+from __future__ import annotations
+
+import math
+import os
+from typing import Dict, Optional
+
+import pandas as pd
+
+from engine import ERROR_COLUMNS
+
+
+OTHERS = "Otros"
+DEFAULT_TOP_N = 25
+DEFAULT_MAX_BARS = 2000
+DEFAULT_MAX_FACETS = 24
+
+
+def top_n() -> int:
+    return int(os.environ.get("PYECH_CHART_TOP_N", DEFAULT_TOP_N))
+
+
+def max_bars() -> int:
+    return int(os.environ.get("PYECH_CHART_MAX_BARS", DEFAULT_MAX_BARS))
+
+
+def max_facets() -> int:
+    return int(os.environ.get("PYECH_CHART_MAX_FACETS", DEFAULT_MAX_FACETS))
+
+
+def collapse_limits(
+    cardinalities: Dict[str, int], top: int = None, bars: int = None
+) -> Dict[str, int]:
+    """Number of values to keep of each grouper that has to be collapsed for the chart.
+
+    Groupers with more than `top` distinct values keep their `top` largest. While the
+    estimated number of bars is over `bars`, the grouper contributing the most values
+    keeps one fewer. Groupers absent from the result are left as they are.
+    """
+    top = top_n() if top is None else top
+    bars = max_bars() if bars is None else bars
+    sizes = dict(cardinalities)
+    limits = {}
+    for column, size in sizes.items():
+        if size > top:
+            limits[column] = top
+            sizes[column] = top + 1
+    while sizes and math.prod(sizes.values()) > bars:
+        column = max(sizes, key=sizes.get)
+        if sizes[column] <= 2:
+            break
+        sizes[column] -= 1
+        limits[column] = sizes[column] - 1
+    return limits
+
+
+def collapse(
+    frame: pd.DataFrame,
+    limits: Dict[str, int],
+    y: str,
+    weights: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    """`frame` with the values of each grouper in `limits` beyond its largest merged into `OTHERS`.
+
+    Values are ranked by their total `y`. Merged groups add up `y`, unless `weights` is
+    given: a frame with the same groupers and the weight total of each group in column
+    `y`, with which merged means are weighted. Error columns of merged groups are left
+    empty, since they cannot be derived from the groups' own errors.
+    """
+    limits = {c: n for c, n in limits.items() if c in frame.columns}
+    if not limits:
+        return frame
+    values = [y] + [c for c in ERROR_COLUMNS if c in frame.columns]
+    keys = [c for c in frame.columns if c not in values]
+    if weights is not None:
+        weights = frame[keys].merge(weights[keys + [y]], on=keys, how="left")[y].to_numpy()
+        ranking = frame[y] * weights
+    else:
+        ranking = frame[y]
+    collapsed = frame.copy()
+    for column, keep in limits.items():
+        totals = ranking.abs().groupby(frame[column], sort=False).sum()
+        kept = totals.nlargest(keep).index
+        collapsed[column] = frame[column].astype(object).where(frame[column].isin(kept), OTHERS)
+    merged = collapsed.duplicated(keys, keep=False).to_numpy()
+    if not merged.any():
+        return collapsed
+    parts = collapsed[merged]
+    groups = [parts[k] for k in keys]
+    if weights is None:
+        totals = parts[y].groupby(groups, sort=False, dropna=False).sum()
+    else:
+        w = pd.Series(weights[merged], index=parts.index)
+        totals = (parts[y] * w).groupby(groups, sort=False, dropna=False).sum() / w.groupby(
+            groups, sort=False, dropna=False
+        ).sum()
+    totals = totals.rename(y).reset_index()
+    return pd.concat([collapsed[~merged], totals], ignore_index=True)[list(frame.columns)]
@@ -0,0 +1,106 @@
+"""Read-only, DataFrame-like survey data whose columns are materialized on first access.
+
+A summary touches a handful of columns out of several hundred. Backing `survey.data` with
+a `ColumnStore` over the memory-mapped Arrow file makes a cached year ready as soon as
+its metadata and dictionary are read; each column is converted to a pandas Series the
+first time it is used and kept for later queries. The store's `nbytes` grows as columns
+are materialized, and its `on_materialize` callback, if set, is called after each one so
+that an owner keeping a memory budget can re-check it.
+
+Only the subset of the DataFrame API the app relies on is provided: `columns`, `index`,
+`len`, `in`, item access by name or list of names, `take`, `reset_index`, `memory_usage`
+and `to_frame`.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+
+class ColumnStore:
+    def __init__(
+        self,
+        columns: Iterable[str],
+        length: int,
+        load: Callable[[str], pd.Series],
+        root: "ColumnStore" = None,
+    ):
+        self.columns = pd.Index(list(columns))
+        self.index = pd.RangeIndex(length)
+        self.on_materialize: Optional[Callable[[], object]] = None
+        self._load = load
+        self._materialized: Dict[str, pd.Series] = {}
+        self._lock = threading.Lock()
+        # Columns of stores taken from this one are charged to it.
+        self._root = root or self
+        self._nbytes = 0
+
+    @classmethod
+    def from_arrow(cls, table: pa.Table) -> "ColumnStore":
+        def load(name: str) -> pd.Series:
+            return table.column(name).to_pandas().rename(name)
+
+        return cls(table.column_names, table.num_rows, load)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, name) -> bool:
+        return name in self.columns
+
+    def __getitem__(self, key: Union[str, List[str]]):
+        if isinstance(key, (list, tuple, pd.Index)):
+            return pd.DataFrame({name: self[name] for name in key}, index=self.index)
+        column = self._materialized.get(key)
+        if column is None:
+            if key not in self.columns:
+                raise KeyError(key)
+            loaded = self._load(key)
+            with self._lock:
+                column = self._materialized.setdefault(key, loaded)
+            if column is loaded:
+                self._root._charge(int(column.memory_usage(index=False, deep=True)))
+        return column
+
+    def _charge(self, nbytes: int):
+        with self._lock:
+            self._nbytes += nbytes
+        if self.on_materialize is not None:
+            self.on_materialize()
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of the columns materialized so far, here and in the stores taken from it."""
+        return int(self.index.memory_usage()) + self._nbytes
+
+    @property
+    def materialized(self) -> List[str]:
+        return list(self._materialized)
+
+    def take(self, rows: np.ndarray) -> "ColumnStore":
+        """Rows `rows` of every column, themselves materialized on first access."""
+
+        def load(name: str) -> pd.Series:
+            return self[name].take(rows).reset_index(drop=True)
+
+        return ColumnStore(self.columns, len(rows), load, root=self._root)
+
+    def reset_index(self, drop: bool = True) -> "ColumnStore":
+        # Columns always carry a RangeIndex.
+        return self
+
+    def memory_usage(self, index: bool = True, deep: bool = False) -> pd.Series:
+        usage = {
+            name: column.memory_usage(index=False, deep=deep)
+            for name, column in list(self._materialized.items())
+        }
+        if index:
+            usage = {"Index": self.index.memory_usage(), **usage}
+        return pd.Series(usage, dtype=np.int64)
+
+    def to_frame(self) -> pd.DataFrame:
+        return self[list(self.columns)]
@@ -0,0 +1,159 @@
+"""Compact dtypes for loaded survey microdata.
+
+`pyreadstat` returns every numeric column as float64. Most ECH variables are integer
+codes, so after a load:
+
+- integer-valued columns without missing values are downcast to the smallest integer,
+- labelled variables with few distinct codes become `category` over the sorted codes,
+- remaining float columns become float32 when the round trip is exact,
+- weights become float32 when their relative error stays under `WEIGHTS_RTOL`,
+- repeated strings become `category`.
+
+Run ``python compact.py YEAR [YEAR ...]`` to report the savings for fresh downloads and
+check that summaries are unchanged.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+from typing import Dict, List, TYPE_CHECKING, Tuple
+
+import numpy as np
+import pandas as pd
+
+if TYPE_CHECKING:
+    from pyech import ECH
+
+
+logger = logging.getLogger(__name__)
+
+WEIGHTS = ("pesoano", "pesomen", "pesotri")
+WEIGHTS_RTOL = 1e-7
+
+
+def _float32(values: np.ndarray, rtol: float = 0) -> bool:
+    narrowed = values.astype(np.float32).astype(np.float64)
+    if rtol == 0:
+        return np.array_equal(narrowed, values, equal_nan=True)
+    return np.allclose(narrowed, values, rtol=rtol, atol=0, equal_nan=True)
+
+
+def compact_column(
+    column: pd.Series, labelled: bool, categorical_threshold: int
+) -> pd.Series:
+    if column.dtype.kind == "O":
+        if column.nunique() <= len(column) // 2:
+            return column.astype("category")
+        return column
+    if column.dtype.kind in "biu":
+        return pd.to_numeric(column, downcast="integer")
+    if column.dtype.kind != "f":
+        # Dates and durations are int64 underneath; downcasting would drop their dtype.
+        return column
+    values = column.to_numpy()
+    missing = np.isnan(values).any()
+    if labelled and column.nunique() <= categorical_threshold:
+        categories = np.sort(column.dropna().unique())
+        return pd.Series(
+            pd.Categorical(values, categories=categories),
+            index=column.index,
+            name=column.name,
+        )
+    if not missing:
+        downcast = pd.to_numeric(column, downcast="integer")
+        if downcast.dtype.kind in "iu":
+            return downcast
+    rtol = WEIGHTS_RTOL if column.name in WEIGHTS else 0
+    if _float32(values, rtol):
+        return column.astype(np.float32)
+    return column
+
+
+def compact(survey: ECH) -> Dict[str, float]:
+    """Compact `survey.data` in place and report its size before and after."""
+    before = int(survey.data.memory_usage(index=True, deep=True).sum())
+    labelled = survey.metadata.variable_value_labels
+    survey.data = pd.DataFrame(
+        {
+            name: compact_column(
+                survey.data[name], name in labelled, survey.categorical_threshold
+            )
+            for name in survey.data.columns
+        },
+        index=survey.data.index,
+    )
+    after = int(survey.data.memory_usage(index=True, deep=True).sum())
+    report = {"before": before, "after": after, "ratio": before / after if after else 0}
+    logger.info(
+        "Compacted survey data from %.1f MB to %.1f MB (%.1fx)",
+        before / 2 ** 20,
+        after / 2 ** 20,
+        report["ratio"],
+    )
+    return report
+
+
+def sample_specs(survey: ECH, n: int = 10) -> List[Tuple[str, List[str], bool]]:
+    from cube import configured_groupings
+    from engine import AggregationEngine
+
+    engine = AggregationEngine(survey, precompute=False)
+    columns = [c for c in survey.data.columns if c not in WEIGHTS]
+    numeric = [c for c in columns if not engine.is_categorical(c)][:n]
+    categorical = [c for c in columns if engine.is_categorical(c)][:n]
+    groupings = [
+        list(g) for g in configured_groupings() if set(g).issubset(survey.data.columns)
+    ] or [[]]
+    specs = []
+    for i, variable in enumerate(numeric + categorical):
+        specs.append((variable, groupings[i % len(groupings)], variable in categorical))
+    return specs
+
+
+def verify(original: ECH, compacted: ECH, weights: str = "pesoano"):
+    """Raise if any sample summary of `compacted` differs from the one of `original`."""
+    from engine import AggregationEngine
+
+    expected_engine = AggregationEngine(original, precompute=False)
+    result_engine = AggregationEngine(compacted, precompute=False)
+    for variable, by, is_categorical in sample_specs(original):
+        for aggfunc in ("sum", "mean", "count"):
+            for household_level in (False, True):
+                kwargs = dict(
+                    aggfunc=aggfunc,
+                    is_categorical=is_categorical,
+                    household_level=household_level,
+                    weights=weights,
+                )
+                pd.testing.assert_frame_equal(
+                    result_engine.summarize(variable, by, **kwargs),
+                    expected_engine.summarize(variable, by, **kwargs),
+                    check_dtype=False,
+                    check_categorical=False,
+                    rtol=WEIGHTS_RTOL * 10,
+                )
+                if is_categorical:
+                    break
+
+
+def main():
+    import copy
+
+    from cache import fetch_survey
+
+    parser = argparse.ArgumentParser(description="Report and verify dtype compaction.")
+    parser.add_argument("years", nargs="+", type=int)
+    args = parser.parse_args()
+    for year in args.years:
+        original = fetch_survey(year)
+        compacted = copy.copy(original)
+        report = compact(compacted)
+        verify(original, compacted)
+        print(
+            f"{year}: {report['before'] / 2 ** 20:.1f} MB -> "
+            f"{report['after'] / 2 ** 20:.1f} MB ({report['ratio']:.1f}x), summaries unchanged"
+        )
+
+
+if __name__ == "__main__":
+    main()
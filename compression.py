@@ -0,0 +1,64 @@
+"""Response compression for the Flask server.
+
+Responses of the compressible types above `PYECH_COMPRESS_MIN_BYTES` are compressed with
+brotli when the client accepts it and gzip otherwise, through flask-compress. Levels
+favour speed, since callback responses are compressed on every request. Streamed
+responses, such as the batch API and downloads, are left alone so they keep streaming.
+
+The size of every callback response before and after compression is logged at debug
+level and recorded in the `pyech_callback_transfer_bytes` metric.
+"""
+import logging
+import os
+
+from flask import g, request
+from flask_compress import Compress
+
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_BYTES = 1024
+CALLBACK_PATH = "/_dash-update-component"
+MIMETYPES = [
+    "application/json",
+    "application/javascript",
+    "text/css",
+    "text/html",
+    "text/plain",
+    "text/csv",
+]
+
+
+def _before_compression(response):
+    if request.path.endswith(CALLBACK_PATH) and not response.is_streamed:
+        g.uncompressed_bytes = response.calculate_content_length()
+    return response
+
+
+def _after_compression(response):
+    before = g.get("uncompressed_bytes")
+    if before is None:
+        return response
+    after = response.calculate_content_length()
+    encoding = response.headers.get("Content-Encoding", "identity")
+    callback = g.get("callback", "unknown")
+    metrics.transfer_bytes.observe(after, callback, encoding)
+    logger.debug("Callback %s sent %d bytes as %d (%s)", callback, before, after, encoding)
+    return response
+
+
+def init_compression(server):
+    server.config.update(
+        COMPRESS_ALGORITHM=["br", "gzip"],
+        COMPRESS_MIMETYPES=MIMETYPES,
+        COMPRESS_MIN_SIZE=int(os.environ.get("PYECH_COMPRESS_MIN_BYTES", DEFAULT_MIN_BYTES)),
+        COMPRESS_LEVEL=5,
+        COMPRESS_BR_LEVEL=4,
+        COMPRESS_STREAMS=False,
+    )
+    # after_request functions run in reverse order of registration.
+    server.after_request(_after_compression)
+    Compress(server)
+    server.after_request(_before_compression)
@@ -0,0 +1,187 @@
+"""Materialized partial aggregates for the groupings most users ask for.
+
+Right after a survey loads, a background thread computes weighted sums, weight totals
+and counts of the configured numeric variables for each configured grouping, weight and
+level, reading only those columns, so a lazily loaded survey stays mostly unmaterialized.
+Summaries over exactly one of those groupings are then finalized from the cube without
+scanning the microdata. Cells are persisted next to the survey in the on-disk cache,
+under names keyed by the variables they hold and the cube and cache formats, so a change
+of configuration or format builds them again instead of serving stale ones.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, TYPE_CHECKING, Tuple
+
+import numpy as np
+import pandas as pd
+
+from cache import CACHE_FORMAT_VERSION, SurveyCache, pyech_revision, read_arrow, write_arrow
+from engine import AggregationEngine, Partials, accumulate, group_index
+
+if TYPE_CHECKING:
+    from pyech import ECH
+
+
+CUBE_FORMAT_VERSION = 2
+DEFAULT_GROUPINGS = [
+    ["dpto"],
+    ["e26"],
+    ["region_4"],
+    ["dpto", "e26"],
+    ["e26", "region_4"],
+]
+DEFAULT_VARIABLES = ["ht11", "ht13", "ht19", "pt1", "pt2", "pt4", "e27"]
+WEIGHTS = ("pesoano", "pesomen")
+LEVELS = (False, True)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cube")
+
+
+def configured_groupings() -> List[Tuple[str, ...]]:
+    groupings = json.loads(os.environ.get("PYECH_CUBE_GROUPINGS", "null"))
+    groupings = DEFAULT_GROUPINGS if groupings is None else groupings
+    return [tuple(sorted(grouping)) for grouping in groupings if grouping]
+
+
+def configured_variables() -> List[str]:
+    variables = json.loads(os.environ.get("PYECH_CUBE_VARIABLES", "null"))
+    return DEFAULT_VARIABLES if variables is None else variables
+
+
+def cell_prefix(weights: str, household_level: bool, grouping: Tuple[str, ...]) -> str:
+    level = "hogares" if household_level else "personas"
+    return f"{weights}-{level}-{'+'.join(grouping)}-"
+
+
+def cell_name(
+    weights: str, household_level: bool, grouping: Tuple[str, ...], variables: List[str]
+) -> str:
+    key = (
+        CUBE_FORMAT_VERSION, CACHE_FORMAT_VERSION, pyech_revision(), grouping, sorted(variables)
+    )
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:12]
+    return f"{cell_prefix(weights, household_level, grouping)}{digest}.arrow"
+
+
+def build_cell(
+    engine: AggregationEngine,
+    grouping: Tuple[str, ...],
+    weights: str,
+    household_level: bool,
+    variables: List[str],
+) -> pd.DataFrame:
+    codes = [engine.codes(c, household_level) for c in grouping]
+    ids, first = group_index([c.codes for c in codes], [len(c.uniques) for c in codes])
+    w = engine.values(weights, household_level)
+    columns = {c: codes[i].codes[first] for i, c in enumerate(grouping)}
+    for variable in variables:
+        x = engine.values(variable, household_level)
+        wsum, wtotal, count, missing = accumulate(ids, len(first), w, x)
+        columns[f"wsum:{variable}"] = wsum
+        columns[f"wtotal:{variable}"] = wtotal
+        columns[f"count:{variable}"] = count
+        columns[f"missing:{variable}"] = missing
+    return pd.DataFrame(columns)
+
+
+def discard_stale(directory: str, prefix: str, name: str):
+    """Delete the cells sharing `prefix` (weights, level and grouping) other than `name`."""
+    for other in os.listdir(directory):
+        if other.startswith(prefix) and other.endswith(".arrow") and other != name:
+            try:
+                os.remove(os.path.join(directory, other))
+            except FileNotFoundError:
+                pass
+
+
+class Cube:
+    def __init__(self, cells: Dict[tuple, pd.DataFrame]):
+        self.cells = cells
+
+    @property
+    def nbytes(self) -> int:
+        return sum(int(cell.memory_usage(index=True).sum()) for cell in self.cells.values())
+
+    @classmethod
+    def build(
+        cls,
+        engine: AggregationEngine,
+        groupings: List[Tuple[str, ...]],
+        variables: List[str],
+        directory: str = None,
+    ) -> "Cube":
+        """Build every cell whose groupers and weights exist, reusing persisted cells.
+
+        Cells hold the numeric ones among `variables` that the survey has.
+        """
+        columns = set(engine.data.columns)
+        present = [c for c in dict.fromkeys(variables) if c in columns]
+        numeric = None
+        cells = {}
+        for grouping in groupings:
+            if not columns.issuperset(grouping):
+                continue
+            for weights in WEIGHTS:
+                if weights not in columns:
+                    continue
+                for household_level in LEVELS:
+                    key = (weights, household_level, grouping)
+                    name = cell_name(weights, household_level, grouping, present)
+                    path = directory and os.path.join(directory, name)
+                    if path and os.path.exists(path):
+                        cells[key] = read_arrow(path)
+                        continue
+                    if numeric is None:
+                        # Only when a cell must be built, since it reads the columns.
+                        numeric = [c for c in present if not engine.is_categorical(c)]
+                    cells[key] = build_cell(
+                        engine, grouping, weights, household_level, numeric
+                    )
+                    if path:
+                        os.makedirs(directory, exist_ok=True)
+                        write_arrow(cells[key], path)
+                        discard_stale(
+                            directory, cell_prefix(weights, household_level, grouping), name
+                        )
+        return cls(cells)
+
+    def lookup(
+        self, variable: str, by: List[str], weights: str, household_level: bool
+    ) -> Optional[Partials]:
+        by = list(by or [])
+        cell = self.cells.get((weights, bool(household_level), tuple(sorted(by))))
+        # Cells persisted before missing rows were counted cannot finalize means.
+        if cell is None or f"missing:{variable}" not in cell.columns:
+            return None
+        # Cells are ordered by their sorted groupers; restore the order `by` implies.
+        order = np.lexsort([cell[c].to_numpy() for c in reversed(by)])
+        return Partials(
+            cell[by].iloc[order].reset_index(drop=True),
+            cell[f"wsum:{variable}"].to_numpy()[order],
+            cell[f"wtotal:{variable}"].to_numpy()[order],
+            cell[f"count:{variable}"].to_numpy()[order],
+            cell[f"missing:{variable}"].to_numpy()[order],
+        )
+
+
+def materialize(registry, year: int, survey: ECH):
+    """Registry hook that builds the cube for a freshly loaded year in the background."""
+
+    def run():
+        if year not in registry:
+            return
+        view = registry.view(year)
+        engine = view.derived("engine")
+        cube = Cube.build(
+            engine,
+            configured_groupings(),
+            configured_variables(),
+            SurveyCache().path(year, "cube"),
+        )
+        view.derived("cube", lambda survey: cube)
+
+    return _executor.submit(run)
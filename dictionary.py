@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from functools import lru_cache
+from typing import FrozenSet, List
+
+import numpy as np
+import pandas as pd
+
+
+TOKEN = re.compile(r"\w+")
+FILTER_OPERATORS = [
+    ["ge ", ">="],
+    ["le ", "<="],
+    ["lt ", "<"],
+    ["gt ", ">"],
+    ["ne ", "!="],
+    ["eq ", "="],
+    ["contains "],
+    ["datestartswith "],
+]
+
+
+def normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN.findall(normalize(text))
+
+
+class DictionaryIndex:
+    """Accent-insensitive inverted index (token -> row ids) over every dictionary column.
+
+    Each query token matches any indexed token it is a prefix of, so results refine as the
+    user types. Prefix lookups are memoized because consecutive keystrokes share them.
+    """
+
+    def __init__(self, dictionary: pd.DataFrame):
+        self.frame = dictionary.reset_index(drop=True)
+        postings = defaultdict(set)
+        for column in self.frame.columns:
+            for row, value in enumerate(self.frame[column]):
+                if pd.isna(value):
+                    continue
+                for token in tokenize(value):
+                    postings[token].add(row)
+        self.tokens = sorted(postings)
+        self.postings = {token: frozenset(rows) for token, rows in postings.items()}
+        self.all_rows = np.arange(len(self.frame))
+        self._prefix_rows = lru_cache(maxsize=4096)(self._prefix_rows)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.frame.memory_usage(index=True, deep=True).sum())
+
+    def _prefix_rows(self, prefix: str) -> FrozenSet[int]:
+        start = bisect_left(self.tokens, prefix)
+        end = bisect_left(self.tokens, prefix + "\uffff", lo=start)
+        return frozenset().union(*(self.postings[t] for t in self.tokens[start:end]))
+
+    def search(self, term: str) -> np.ndarray:
+        tokens = tokenize(term or "")
+        if not tokens:
+            return self.all_rows
+        rows = self._prefix_rows(tokens[0])
+        for token in tokens[1:]:
+            if not rows:
+                break
+            rows = rows & self._prefix_rows(token)
+        return np.array(sorted(rows), dtype=int)
+
+
+def split_filter_part(filter_part: str):
+    for operator_type in FILTER_OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find("{") + 1 : name_part.rfind("}")]
+                value_part = value_part.strip()
+                v0 = value_part[0]
+                if v0 == value_part[-1] and v0 in ("'", '"', "`"):
+                    value = value_part[1:-1].replace("\\" + v0, v0)
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+                return name, operator_type[0].strip(), value
+    return [None] * 3
+
+
+def query_table(frame: pd.DataFrame, filter_query: str, sort_by: list) -> pd.DataFrame:
+    """Apply a DataTable `filter_query` and `sort_by` to `frame`, as `page_action="custom"`."""
+    for filter_part in (filter_query or "").split(" && "):
+        name, operator, value = split_filter_part(filter_part)
+        if name not in frame.columns:
+            continue
+        column = frame[name]
+        if operator in ("eq", "ne", "lt", "le", "gt", "ge"):
+            if isinstance(value, float) and column.dtype.kind not in "biuf":
+                column = pd.to_numeric(column, errors="coerce")
+            frame = frame.loc[getattr(column, operator)(value)]
+        elif operator == "contains":
+            frame = frame.loc[
+                column.astype(str).map(normalize).str.contains(
+                    normalize(value), regex=False
+                )
+            ]
+        elif operator == "datestartswith":
+            frame = frame.loc[column.astype(str).str.startswith(str(value))]
+    if sort_by:
+        frame = frame.sort_values(
+            [col["column_id"] for col in sort_by],
+            ascending=[col["direction"] == "asc" for col in sort_by],
+            inplace=False,
+        )
+    return frame
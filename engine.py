@@ -0,0 +1,558 @@
+"""Vectorized weighted group-by used by the summarize callback.
+
+Category codes for every categorical column are computed once when a survey loads.
+A summary then reduces to building a combined group key from those codes and
+accumulating weights with `np.bincount`, instead of a pandas group-by over the microdata.
+
+Missing values are handled the way `ECH.summarize` handles them: rows with a missing
+grouper form a group of their own, sorted last, like pandas' ``dropna=False``; sums and
+counts skip missing terms, like pandas group sums; and the mean of a group with any
+missing value or weight is missing, like `np.average`.
+
+Recent partial aggregates are kept, so drilling up answers a summary whose groupers are
+a subset of a kept grouping's by re-aggregating that small table. Results must equal a
+direct computation bit for bit, so groups are only merged when no addition can round:
+the rows' weights and weighted values are integers and their total stays below 2**53.
+
+A `Filter` restricts a summary to a subpopulation: the row mask its bitmap indexes
+evaluate to marks the codes of excluded rows as missing, so they fall out of every group.
+
+Standard errors use Taylor linearization with households as primary sampling units,
+assumed sampled with replacement: the linearized values are summed per (group, household)
+pair and their spread across households gives every group's variance in one pass. This
+simplifies the ECH design, whose strata and primary sampling units (UPM) are ignored, so
+the errors approximate, but do not reproduce, those computed with the full design.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, TYPE_CHECKING, Tuple
+
+import numpy as np
+import pandas as pd
+
+from bitmaps import BitmapIndex, Filter
+from households import Households
+
+if TYPE_CHECKING:
+    from pyech import ECH
+
+DENSE_KEY_LIMIT = 2 ** 24
+EXACT_LIMIT = 2 ** 52
+# Relative tolerance of engine results against `ECH.summarize`; see `accumulate`.
+VERIFY_RTOL = 1e-9
+DEFAULT_ROLLUP_ENTRIES = 64
+Z_95 = 1.959963984540054
+ERROR_COLUMNS = ("Error estándar", "IC 95% inf", "IC 95% sup", "CV")
+
+
+class Codes(NamedTuple):
+    codes: np.ndarray
+    uniques: np.ndarray
+
+
+class Partials(NamedTuple):
+    """Additive per-group aggregates from which every `aggfunc` can be finalized.
+
+    `missing` counts the rows whose value or weight is missing. `exact` is set when no
+    sum rounded, so the partials of merged groups add up to the same floats as the rows
+    of the merged group.
+    """
+
+    groups: pd.DataFrame
+    wsum: np.ndarray
+    wtotal: np.ndarray
+    count: np.ndarray
+    missing: np.ndarray
+    exact: bool = False
+
+
+def factorize(column: pd.Series) -> Codes:
+    """Codes of `column` in sorted order of its values, with a last one for missing values."""
+    if column.dtype.name == "category":
+        codes = column.cat.codes.to_numpy()
+        uniques = column.cat.categories.to_numpy()
+    else:
+        codes, uniques = pd.factorize(column, sort=True)
+        uniques = np.asarray(uniques)
+    if (codes < 0).any():
+        codes = np.where(codes < 0, len(uniques), codes)
+        uniques = np.append(uniques, np.nan)
+    dtype = np.int16 if len(uniques) < np.iinfo(np.int16).max else np.int32
+    return Codes(codes.astype(dtype, copy=False), uniques)
+
+
+def code_text(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def group_index(codes: List[np.ndarray], sizes: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Combine per-grouper codes into dense group ids in lexicographic order of the codes.
+
+    Returns the group id of every row (-1 where any code is negative, as for the rows a
+    filter leaves out) and the row position of the first member of each group.
+    """
+    n = len(codes[0])
+    key = np.zeros(n, dtype=np.int64)
+    valid = np.ones(n, dtype=bool)
+    span = 1
+    for c, size in zip(codes, sizes):
+        valid &= c >= 0
+        key = key * size + c
+        span *= size
+        if span > DENSE_KEY_LIMIT:
+            # Re-number the observed combinations so the key cannot overflow.
+            observed, key = np.unique(key[valid], return_inverse=True)
+            key = np.where(valid, _expand(key, valid), -1)
+            span = len(observed)
+    if span <= DENSE_KEY_LIMIT:
+        present = np.bincount(key[valid], minlength=span) > 0
+        lookup = np.cumsum(present) - 1
+        ids = np.where(valid, lookup[np.where(valid, key, 0)], -1)
+    else:
+        _, ids = np.unique(key[valid], return_inverse=True)
+        ids = np.where(valid, _expand(ids, valid), -1)
+    rows = np.flatnonzero(valid)
+    _, first = np.unique(ids[rows], return_index=True)
+    return ids, rows[first]
+
+
+def _expand(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    expanded = np.zeros(len(mask), dtype=np.int64)
+    expanded[mask] = values
+    return expanded
+
+
+def _terms(
+    ids: np.ndarray, w: np.ndarray, x: np.ndarray = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # Rows left out by a filter have no group; within a group, missing terms add nothing.
+    inside = ids >= 0
+    ids, w = ids[inside], w[inside]
+    z = w if x is None else x[inside] * w
+    return ids, w, ~np.isnan(w), z
+
+
+def accumulate(
+    ids: np.ndarray, ngroups: int, w: np.ndarray, x: np.ndarray = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Weighted sum of `x`, weight total, row count and missing rows per group id.
+
+    As in `ECH.summarize`, missing weights are left out of the weight total and missing
+    weighted values out of the weighted sum, while `missing` counts the rows with either,
+    whose group mean is missing. Rows without a group are skipped.
+
+    Sums are accumulated in row order, so any caller passing the same rows gets identical
+    floats. They are not bit-identical to `ECH.summarize`, whose pandas group sums are
+    compensated and whose `np.average` means are summed pairwise: with fractional
+    weights the results differ in the last few bits, well within `VERIFY_RTOL`.
+    """
+    ids, w, wok, z = _terms(ids, w, x)
+    zok = ~np.isnan(z)
+    wtotal = np.bincount(ids[wok], weights=w[wok], minlength=ngroups)
+    count = np.bincount(ids, minlength=ngroups)
+    wsum = wtotal if x is None else np.bincount(ids[zok], weights=z[zok], minlength=ngroups)
+    missing = np.bincount(ids[~zok], minlength=ngroups)
+    return wsum, wtotal, count, missing
+
+
+def exact_sums(ids: np.ndarray, w: np.ndarray, x: np.ndarray = None) -> bool:
+    """Whether the terms `accumulate` adds up give the same sums in any order.
+
+    They do when every weight and weighted value is an integer and their absolute total is
+    below `EXACT_LIMIT`, so that no addition rounds.
+    """
+    _, w, wok, z = _terms(ids, w, x)
+    terms = [w[wok]] if x is None else [w[wok], z[~np.isnan(z)]]
+    return all(
+        np.abs(t).sum() < EXACT_LIMIT and np.array_equal(t, np.trunc(t)) for t in terms
+    )
+
+
+def rollup(partials: Partials, groupers: List[str]) -> Partials:
+    """`partials` aggregated over every grouper not in `groupers`, grouped in their order."""
+    groups = partials.groups
+    codes = [groups[c].to_numpy() for c in groupers]
+    # An ungrouped summary's groups frame has no columns, and so no rows, to count.
+    ids, first = group_index(
+        codes or [np.zeros(len(partials.wtotal), dtype=np.int8)],
+        [int(c.max()) + 1 if len(c) else 1 for c in codes] or [1],
+    )
+
+    def add(values: np.ndarray) -> np.ndarray:
+        return np.bincount(ids, weights=values, minlength=len(first)).astype(values.dtype)
+
+    return Partials(
+        pd.DataFrame({c: groups[c].to_numpy()[first] for c in groupers}),
+        add(partials.wsum),
+        add(partials.wtotal),
+        add(partials.count),
+        add(partials.missing),
+        partials.exact,
+    )
+
+
+def linearized_variance(
+    ids: np.ndarray,
+    ngroups: int,
+    psu: np.ndarray,
+    w: np.ndarray,
+    x: np.ndarray = None,
+    ratio: np.ndarray = None,
+    wtotal: np.ndarray = None,
+    npsu: int = None,
+) -> np.ndarray:
+    """Variance per group of the weighted total of `x` (of the weights if `x` is None).
+
+    With `ratio` and `wtotal`, it is the variance of the weighted mean `ratio`, whose
+    linearized value is ``w * (x - ratio) / wtotal``. Rows are skipped like in `accumulate`.
+    `npsu` defaults to the number of units with a row left; for a subpopulation, pass the
+    number in the whole sample, since units without rows in it still count.
+    """
+    ok = (ids >= 0) & ~np.isnan(w)
+    if x is not None:
+        ok &= ~np.isnan(x)
+    ids, psu, w = ids[ok], psu[ok], w[ok]
+    z = w if x is None else w * x[ok]
+    if ratio is not None:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            z = (z - ratio[ids] * w) / wtotal[ids]
+    if npsu is None:
+        npsu = int(psu.max()) + 1 if len(psu) else 1
+    pairs, pair_ids = np.unique(ids.astype(np.int64) * npsu + psu, return_inverse=True)
+    zsum = np.bincount(pair_ids, weights=z)
+    squares = np.bincount(pairs // npsu, weights=zsum ** 2, minlength=ngroups)
+    total = np.bincount(ids, weights=z, minlength=ngroups)
+    if npsu < 2:
+        return np.full(ngroups, np.nan)
+    return npsu / (npsu - 1) * np.maximum(squares - total ** 2 / npsu, 0)
+
+
+class AggregationEngine:
+    """Weighted sums, means and counts over a loaded survey, grouped by category codes.
+
+    Codes and bitmaps built after construction are reported to `on_grow` with their size,
+    so a registry holding the engine can charge them to its memory budget.
+    """
+
+    def __init__(
+        self, survey: ECH, precompute: bool = True, households: Households = None
+    ):
+        self.data = survey.data
+        self.metadata = survey.metadata
+        self.categorical_threshold = survey.categorical_threshold
+        self.categorical: Dict[str, bool] = {}
+        self.households = households or Households.build(self.data)
+        self._codes: Dict[str, Codes] = {}
+        self._household_codes: Dict[str, Codes] = {}
+        self._rollups: "OrderedDict[tuple, Partials]" = OrderedDict()
+        self.rollup_entries = int(
+            os.environ.get("PYECH_ROLLUP_ENTRIES", DEFAULT_ROLLUP_ENTRIES)
+        )
+        self._lock = threading.Lock()
+        self.on_grow: Optional[Callable[[int], None]] = None
+        if precompute:
+            for column in self.data.columns:
+                if self.is_categorical(column):
+                    self.codes(column)
+        self.bitmaps = BitmapIndex(self, precompute)
+
+    @property
+    def nbytes(self) -> int:
+        codes = list(self._codes.values()) + list(self._household_codes.values())
+        return (
+            sum(c.codes.nbytes for c in codes) + self.households.nbytes + self.bitmaps.nbytes
+        )
+
+    def _guess_categorical(self, column: pd.Series) -> bool:
+        if column.dtype.name in ("object", "category"):
+            return True
+        return column.nunique() <= self.categorical_threshold
+
+    def is_categorical(self, variable: str) -> bool:
+        categorical = self.categorical.get(variable)
+        if categorical is None:
+            categorical = self._guess_categorical(self.data[variable])
+            self.categorical[variable] = categorical
+        return categorical
+
+    def grew(self, nbytes: int):
+        """Report `nbytes` more held by the engine to `on_grow`."""
+        on_grow = self.on_grow
+        if on_grow is not None:
+            on_grow(nbytes)
+
+    def codes(self, column: str, household_level: bool = False) -> Codes:
+        codes = self._codes.get(column)
+        if codes is None:
+            built = factorize(self.data[column])
+            with self._lock:
+                codes = self._codes.setdefault(column, built)
+            if codes is built:
+                self.grew(built.codes.nbytes)
+        if not household_level:
+            return codes
+        household_codes = self._household_codes.get(column)
+        if household_codes is None:
+            # Shares the person-level uniques, so group codes and labels line up.
+            built = Codes(codes.codes[self.households.rows], codes.uniques)
+            with self._lock:
+                household_codes = self._household_codes.setdefault(column, built)
+            if household_codes is built:
+                self.grew(built.codes.nbytes)
+        return household_codes
+
+    def distinct(self, column: str) -> int:
+        """Number of distinct values of `column`, from its precomputed category codes."""
+        return len(self.codes(column).uniques)
+
+    def values(self, column: str, household_level: bool = False) -> np.ndarray:
+        frame = self.households.frame if household_level else self.data
+        return np.asarray(frame[column], dtype=np.float64)
+
+    def mask(self, where: Filter, household_level: bool = False) -> np.ndarray:
+        """Rows selected by `where`, at the requested level.
+
+        At household level, a household is selected by the row of its first person, which
+        carries the household variables.
+        """
+        mask = self.bitmaps.mask(where)
+        return mask[self.households.rows] if household_level else mask
+
+    def label(self, column: str, values: np.ndarray) -> list:
+        """Value labels of `values`, with unlabelled codes as text so the column has one type.
+
+        Missing values stay missing.
+        """
+        labels = self.metadata.variable_value_labels.get(column)
+        if not labels:
+            return list(values)
+        return [
+            v if pd.isna(v) else labels[v] if v in labels else code_text(v) for v in values
+        ]
+
+    def partials(
+        self,
+        variable: str,
+        by: List[str],
+        weights: str,
+        is_categorical: bool = None,
+        household_level: bool = False,
+        where: Filter = None,
+    ) -> Partials:
+        """Partial aggregates of a summary, rolled up from a kept finer grouping if possible."""
+        if is_categorical is None:
+            is_categorical = self.is_categorical(variable)
+        by = list(by or [])
+        groupers = by + [variable] if is_categorical else by
+        key = (variable, weights, is_categorical, bool(household_level), where)
+        partials = self.rolled_up(key, groupers)
+        if partials is None:
+            mask = None if where is None else self.mask(where, household_level)
+            partials = self._aggregate(
+                variable, by, weights, is_categorical, household_level, mask
+            )[0]
+            self._keep(key, groupers, partials)
+        return partials
+
+    def rolled_up(self, key: tuple, groupers: List[str]) -> Optional[Partials]:
+        """Partials for `groupers` from the smallest kept grouping that contains them."""
+        with self._lock:
+            entries = [
+                (kept, partials)
+                for (other, kept), partials in self._rollups.items()
+                if other == key and set(groupers).issubset(kept)
+            ]
+        best = None
+        for kept, partials in entries:
+            dropped = [c for c in kept if c not in groupers]
+            if dropped and not partials.exact:
+                continue
+            if best is None or len(partials.wtotal) < len(best.wtotal):
+                best = partials
+        if best is None:
+            return None
+        return rollup(best, groupers)
+
+    def _keep(self, key: tuple, groupers: List[str], partials: Partials):
+        with self._lock:
+            self._rollups[(key, tuple(groupers))] = partials
+            self._rollups.move_to_end((key, tuple(groupers)))
+            while len(self._rollups) > self.rollup_entries:
+                self._rollups.popitem(last=False)
+
+    def clear_rollups(self):
+        with self._lock:
+            self._rollups.clear()
+
+    def _aggregate(
+        self,
+        variable: str,
+        by: List[str],
+        weights: str,
+        is_categorical: bool,
+        household_level: bool,
+        mask: np.ndarray = None,
+    ) -> Tuple[Partials, np.ndarray, np.ndarray, np.ndarray]:
+        by = list(by or [])
+        groupers = by + [variable] if is_categorical else by
+        w = self.values(weights, household_level)
+        codes = [self.codes(c, household_level) for c in groupers]
+        keys = [c.codes for c in codes] or [np.zeros(len(w), dtype=np.int8)]
+        if mask is not None:
+            keys = [np.where(mask, k, -1) for k in keys]
+        ids, first = group_index(keys, [len(c.uniques) for c in codes] or [1])
+        x = None if is_categorical else self.values(variable, household_level)
+        wsum, wtotal, count, missing = accumulate(ids, len(first), w, x)
+        groups = pd.DataFrame({c: codes[i].codes[first] for i, c in enumerate(groupers)})
+        exact = exact_sums(ids, w, x)
+        return Partials(groups, wsum, wtotal, count, missing, exact), ids, w, x
+
+    def psu(self, household_level: bool = False) -> np.ndarray:
+        """Primary sampling unit of every row: its household."""
+        if household_level:
+            return np.arange(len(self.households.rows))
+        person_household = np.asarray(self.households.person_household)
+        # People without a first-person row form one extra unit.
+        return np.where(
+            person_household >= 0, person_household, len(self.households.rows)
+        )
+
+    def standard_errors(
+        self,
+        variable: str,
+        by: List[str],
+        aggfunc: str,
+        weights: str,
+        is_categorical: bool = None,
+        household_level: bool = False,
+        mask: np.ndarray = None,
+    ) -> Tuple[Partials, np.ndarray]:
+        """Partial aggregates of a summary and the standard error of each group's estimate.
+
+        Households are the sampling units; the strata and UPM of the ECH are not used.
+        """
+        if is_categorical is None:
+            is_categorical = self.is_categorical(variable)
+        partials, ids, w, x = self._aggregate(
+            variable, by, weights, is_categorical, household_level, mask
+        )
+        ngroups = len(partials.wtotal)
+        psu = self.psu(household_level)
+        # Every unit of the sample counts, including those with no row left in the summary.
+        npsu = int(psu.max()) + 1
+        if is_categorical or aggfunc == "count":
+            variance = linearized_variance(ids, ngroups, psu, w, npsu=npsu)
+        elif aggfunc == "sum":
+            variance = linearized_variance(ids, ngroups, psu, w, x, npsu=npsu)
+        elif aggfunc == "mean":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                ratio = partials.wsum / partials.wtotal
+            variance = linearized_variance(
+                ids, ngroups, psu, w, x, ratio=ratio, wtotal=partials.wtotal, npsu=npsu
+            )
+            # Like the mean itself, undefined for groups with missing values.
+            variance[partials.missing > 0] = np.nan
+        else:
+            raise ValueError(f"Unsupported aggfunc: {aggfunc}")
+        return partials, np.sqrt(variance)
+
+    def finalize(
+        self,
+        partials: Partials,
+        variable: str,
+        aggfunc: str,
+        is_categorical: bool,
+        se: np.ndarray = None,
+    ) -> pd.DataFrame:
+        """Turn partial aggregates into the frame `ECH.summarize` returns.
+
+        With standard errors `se`, the 95% confidence interval bounds and the coefficient
+        of variation of each estimate are appended as `ERROR_COLUMNS`.
+        """
+        output = {
+            c: self.label(c, self.codes(c).uniques[partials.groups[c].to_numpy()])
+            for c in partials.groups.columns
+        }
+        if is_categorical:
+            output["Recuento"] = partials.wtotal
+        elif aggfunc == "sum":
+            output[variable] = partials.wsum
+        elif aggfunc == "mean":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = partials.wsum / partials.wtotal
+            output[variable] = np.where(partials.missing > 0, np.nan, mean)
+        elif aggfunc == "count":
+            output[variable] = partials.wtotal
+        else:
+            raise ValueError(f"Unsupported aggfunc: {aggfunc}")
+        if se is not None:
+            estimate = output["Recuento" if is_categorical else variable]
+            error, lower, upper, cv = ERROR_COLUMNS
+            output[error] = se
+            output[lower] = estimate - Z_95 * se
+            output[upper] = estimate + Z_95 * se
+            with np.errstate(invalid="ignore", divide="ignore"):
+                output[cv] = se / np.abs(estimate)
+        return pd.DataFrame(output)
+
+    def summarize(
+        self,
+        variable: str,
+        by: List[str] = None,
+        aggfunc: str = "mean",
+        is_categorical: bool = None,
+        household_level: bool = False,
+        weights: str = None,
+        cube=None,
+        errors: bool = False,
+        where: Filter = None,
+    ) -> pd.DataFrame:
+        """Summarize `variable` like `ECH.summarize`, answering from `cube` when it can.
+
+        With `errors`, standard errors, confidence intervals and coefficients of variation
+        are added; those need the microdata, so the cube is not used. Neither is it with
+        `where`, which restricts the summary to the rows it selects. Otherwise, partials
+        kept from a finer grouping are rolled up when that gives the same result.
+        """
+        if not weights:
+            raise AttributeError("Summarization requires that `weights` is defined.")
+        if is_categorical is None:
+            is_categorical = self.is_categorical(variable)
+        if errors:
+            mask = None if where is None else self.mask(where, household_level)
+            partials, se = self.standard_errors(
+                variable, by, aggfunc, weights, is_categorical, household_level, mask
+            )
+            return self.finalize(partials, variable, aggfunc, is_categorical, se)
+        partials = None
+        if cube is not None and not is_categorical and where is None:
+            partials = cube.lookup(variable, by, weights, household_level)
+        if partials is None:
+            partials = self.partials(
+                variable,
+                by,
+                weights,
+                is_categorical=is_categorical,
+                household_level=household_level,
+                where=where,
+            )
+        return self.finalize(partials, variable, aggfunc, is_categorical)
+
+
+def verify(
+    survey: ECH, engine: AggregationEngine, variable: str, by: List[str] = None, **kwargs
+):
+    """Raise if the engine output differs from `ECH.summarize` for the same arguments.
+
+    Values are compared up to `VERIFY_RTOL`, since the two sum in different orders.
+    """
+    expected = survey.summarize(variable, by, **kwargs)
+    result = engine.summarize(variable, by, weights=survey.weights, **kwargs)
+    pd.testing.assert_frame_equal(
+        result, expected.reset_index(drop=True), check_dtype=False, rtol=VERIFY_RTOL, atol=0
+    )
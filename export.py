@@ -0,0 +1,155 @@
+"""Server-side CSV and Parquet downloads, streamed in fixed-size chunks.
+
+``GET /export/<handle>.<csv|parquet>`` downloads a summary result by the handle the
+summarize callback issued. ``GET /export/<year>/microdata.<csv|parquet>`` downloads a
+subset of the microdata: `columns` is a comma-separated list of variables and every
+``where=<variable>:<value>[,<value>...]`` keeps the rows whose variable is one of the
+values, e.g. ``/export/2019/microdata.csv?columns=dpto,e26,ht11&where=dpto:1,3``.
+
+Rows are converted and written `CHUNK_ROWS` at a time, so memory use does not grow with
+the size of the extract.
+"""
+from __future__ import annotations
+
+import io
+import os
+from typing import Callable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from flask import Blueprint, Response, abort, jsonify, request
+
+from cache import YEARS, frame_to_arrow
+
+
+DEFAULT_CHUNK_ROWS = 50_000
+FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class _Drain(io.RawIOBase):
+    """Write-only file collecting bytes until they are drained into the response."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def csv_chunks(chunks: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    for i, chunk in enumerate(chunks):
+        yield chunk.to_csv(index=False, header=i == 0).encode()
+
+
+def parquet_chunks(chunks: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    import pyarrow.parquet as pq
+
+    sink = _Drain()
+    writer = None
+    for chunk in chunks:
+        table = frame_to_arrow(chunk)
+        if writer is None:
+            # The schema follows the column dtypes, not the values of the first chunk,
+            # which may be all missing.
+            writer = pq.ParquetWriter(sink, frame_to_arrow(chunk.iloc[:0]).schema)
+        table = table.cast(writer.schema)
+        writer.write_table(table)
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+def frame_chunks(frame: pd.DataFrame, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    for start in range(0, max(len(frame), 1), chunk_rows):
+        yield frame.iloc[start : start + chunk_rows]
+
+
+def subset_chunks(
+    data, columns: List[str], rows: Optional[np.ndarray], chunk_rows: int
+) -> Iterator[pd.DataFrame]:
+    """Chunks of `columns` of `data` at positions `rows` (every row when None)."""
+    series = {c: data[c] for c in columns}
+    total = len(data) if rows is None else len(rows)
+    for start in range(0, max(total, 1), chunk_rows):
+        if rows is None:
+            positions = slice(start, start + chunk_rows)
+        else:
+            positions = rows[start : start + chunk_rows]
+        yield pd.DataFrame(
+            {c: s.iloc[positions].to_numpy() for c, s in series.items()}
+        )
+
+
+def parse_where(data, conditions: List[str]) -> Optional[np.ndarray]:
+    """Positions of the rows matching every ``variable:value[,value...]`` condition."""
+    mask = None
+    for condition in conditions:
+        variable, _, values = condition.partition(":")
+        if variable not in data.columns or not values:
+            raise ValueError(f"Invalid condition: {condition!r}")
+        column = data[variable]
+        wanted = [pd.to_numeric(v, errors="ignore") for v in values.split(",")]
+        matches = column.isin(wanted).to_numpy()
+        mask = matches if mask is None else mask & matches
+    return None if mask is None else np.flatnonzero(mask)
+
+
+def download(chunks: Iterator[pd.DataFrame], fmt: str, filename: str) -> Response:
+    encode = csv_chunks if fmt == "csv" else parquet_chunks
+    return Response(
+        encode(chunks),
+        mimetype=FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
+
+
+def create_blueprint(
+    registry, resolve_result: Callable[[str], Optional[pd.DataFrame]]
+) -> Blueprint:
+    export = Blueprint("export", __name__, url_prefix="/export")
+    chunk_rows = int(os.environ.get("PYECH_EXPORT_CHUNK_ROWS", DEFAULT_CHUNK_ROWS))
+
+    @export.route("/<handle>.<fmt>")
+    def result(handle: str, fmt: str):
+        if fmt not in FORMATS:
+            abort(404)
+        frame = resolve_result(handle)
+        if frame is None:
+            abort(404)
+        return download(frame_chunks(frame, chunk_rows), fmt, f"pyech-{handle[:8]}")
+
+    @export.route("/<int:year>/microdata.<fmt>")
+    def microdata(year: int, fmt: str):
+        if fmt not in FORMATS or year not in YEARS:
+            abort(404)
+        data = registry.get(year).data
+        columns = [c for c in request.args.get("columns", "").split(",") if c]
+        unknown = [c for c in columns if c not in data.columns]
+        if not columns or unknown:
+            return jsonify(error=f"Invalid columns: {', '.join(unknown) or 'none given'}"), 400
+        try:
+            rows = parse_where(data, request.args.getlist("where"))
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        chunks = subset_chunks(data, columns, rows, chunk_rows)
+        return download(chunks, fmt, f"ech-{year}")
+
+    return export
@@ -0,0 +1,17 @@
+# Gunicorn configuration. One worker per available core by default; every worker maps the
+# same on-disk survey cache, so loaded years are shared rather than duplicated per worker.
+import os
+import tempfile
+
+
+bind = os.environ.get("GUNICORN_BIND", f":{os.environ.get('PORT', '8080')}")
+workers = int(os.environ.get("WEB_CONCURRENCY", len(os.sched_getaffinity(0))))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+timeout = 0
+loglevel = "info"
+
+if workers > 1:
+    # Result handles issued by one worker must be resolvable by the others.
+    os.environ.setdefault(
+        "PYECH_RESULT_STORE_DIR", os.path.join(tempfile.gettempdir(), "pyech-results")
+    )
@@ -0,0 +1,96 @@
+"""Household-level view of a survey.
+
+ECH microdata has one row per person, with household variables repeated on every member.
+Household-level summaries use the row of each household's first person (`nper == 1`).
+That frame and the person -> household index are built once per survey and persisted
+next to it in the on-disk cache.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+
+from cache import SurveyCache, read_arrow, survey_year, write_arrow
+from columnstore import ColumnStore
+
+if TYPE_CHECKING:
+    from pyech import ECH
+
+
+HOUSEHOLD_ID = "numero"
+PERSON_NUMBER = "nper"
+
+
+def _save(path: str, array: np.ndarray):
+    tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+class Households:
+    frame_file = "households.arrow"
+    rows_file = "rows.npy"
+    index_file = "person_household.npy"
+
+    def __init__(
+        self, frame: pd.DataFrame, rows: np.ndarray, person_household: np.ndarray
+    ):
+        self.frame = frame
+        self.rows = rows
+        self.person_household = person_household
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            int(self.frame.memory_usage(index=True, deep=True).sum())
+            + self.rows.nbytes
+            + self.person_household.nbytes
+        )
+
+    @classmethod
+    def build(cls, data: pd.DataFrame) -> "Households":
+        rows = np.flatnonzero(np.asarray(data[PERSON_NUMBER]) == 1)
+        frame = data.take(rows).reset_index(drop=True)
+        ids, _ = pd.factorize(data[HOUSEHOLD_ID])
+        position = np.full(ids.max() + 1, -1, dtype=np.int32)
+        position[ids[rows]] = np.arange(len(rows), dtype=np.int32)
+        person_household = np.where(ids >= 0, position[ids], -1).astype(np.int32)
+        return cls(frame, rows, person_household)
+
+    def write(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        _save(os.path.join(directory, self.rows_file), self.rows)
+        _save(os.path.join(directory, self.index_file), self.person_household)
+        # The frame is written last, so its presence marks a complete entry. Frames over
+        # lazily loaded data are not written: they are rebuilt from the rows instead.
+        if isinstance(self.frame, pd.DataFrame):
+            write_arrow(self.frame, os.path.join(directory, self.frame_file))
+
+    @classmethod
+    def read(cls, directory: str, data: ColumnStore = None) -> "Households":
+        """Read households, taking the frame lazily from `data` when it is given."""
+        rows = np.load(os.path.join(directory, cls.rows_file), mmap_mode="r")
+        if data is None:
+            frame = read_arrow(os.path.join(directory, cls.frame_file))
+        else:
+            frame = data.take(rows)
+        return cls(
+            frame, rows, np.load(os.path.join(directory, cls.index_file), mmap_mode="r")
+        )
+
+
+def load_households(survey: ECH, cache: SurveyCache = None) -> Households:
+    """Households of `survey`, read from the on-disk cache or built and written to it."""
+    cache = cache or SurveyCache()
+    directory = cache.path(survey_year(survey), "households")
+    lazy = isinstance(survey.data, ColumnStore)
+    complete = Households.index_file if lazy else Households.frame_file
+    if os.path.exists(os.path.join(directory, complete)):
+        return Households.read(directory, survey.data if lazy else None)
+    households = Households.build(survey.data)
+    households.write(directory)
+    return households
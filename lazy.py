@@ -0,0 +1,70 @@
+"""Deferred imports of heavy third-party modules.
+
+`defer(*names)` puts a placeholder module in `sys.modules` for each name, so later
+``import pandas as pd`` statements return immediately. The real module is imported on
+the first attribute access, under a lock shared by all threads, and its namespace is
+then copied into the placeholder so later lookups cost the same as on the real module.
+`warm_up()` imports every deferred module in a background thread right after startup,
+so the first callback usually finds them loaded.
+
+Project modules use ``from __future__ import annotations`` so that type annotations do
+not count as an attribute access.
+"""
+import importlib
+import os
+import sys
+import threading
+import time
+import types
+from typing import Dict
+
+
+_lock = threading.RLock()
+_deferred: Dict[str, "LazyModule"] = {}
+load_times: Dict[str, float] = {}
+
+
+class LazyModule(types.ModuleType):
+    def __getattr__(self, attr: str):
+        return getattr(load(self.__name__), attr)
+
+
+def load(name: str) -> types.ModuleType:
+    placeholder = _deferred[name]
+    with _lock:
+        module = placeholder.__dict__.get("__real_module__")
+        if module is None:
+            if sys.modules.get(name) is placeholder:
+                del sys.modules[name]
+            start = time.perf_counter()
+            try:
+                module = importlib.import_module(name)
+            except BaseException:
+                sys.modules.setdefault(name, placeholder)
+                raise
+            load_times[name] = time.perf_counter() - start
+            placeholder.__dict__.update(module.__dict__)
+            placeholder.__dict__["__real_module__"] = module
+    return module
+
+
+def defer(*names: str):
+    """Defer importing `names` until first use, unless `PYECH_LAZY_IMPORTS` is 0."""
+    if os.environ.get("PYECH_LAZY_IMPORTS", "1") != "1":
+        return
+    for name in names:
+        if name in sys.modules:
+            continue
+        placeholder = LazyModule(name)
+        _deferred[name] = placeholder
+        sys.modules[name] = placeholder
+
+
+def warm_up() -> threading.Thread:
+    def run():
+        for name in list(_deferred):
+            load(name)
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,272 @@
+"""Callback latency instrumentation exposed in Prometheus text format.
+
+`instrument(app)` wraps every server-side Dash callback and records its latency and the
+size of its request and response. Code inside a callback marks its phases with
+``with phase("aggregate"): ...``; the time not attributed to a phase is recorded as
+``dispatch``, which is mostly Dash encoding the response as JSON. Work outside callbacks,
+such as background survey loads, is recorded under the ``background`` callback.
+
+`register_route(server)` serves everything on ``/metrics``. Each gunicorn worker keeps
+its own metrics, so scrape the workers individually or run a single one.
+
+Set `PYECH_PROFILE_SLOW_MS` to sample the stacks of running callbacks every
+`PYECH_PROFILE_INTERVAL_MS` and write those slower than the threshold to
+`PYECH_PROFILE_DIR` as collapsed stacks, ready for ``flamegraph.pl`` or speedscope.
+"""
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from flask import Response, g, has_request_context, request
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(2 ** i for i in range(8, 28, 2))
+BACKGROUND = "background"
+DISPATCH = "dispatch"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], buckets: tuple):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            pairs = [f'{k}="{v}"' for k, v in zip(self.labels, labels)]
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = ",".join(pairs + [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{{{le}}} {bucket_count}")
+            le = ",".join(pairs + ['le="+Inf"'])
+            lines.append(f"{self.name}_bucket{{{le}}} {count}")
+            label_text = "{" + ",".join(pairs) + "}" if pairs else ""
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+callback_seconds = Histogram(
+    "pyech_callback_seconds",
+    "Server-side latency of Dash callbacks.",
+    ("callback",),
+    LATENCY_BUCKETS,
+)
+phase_seconds = Histogram(
+    "pyech_phase_seconds",
+    "Time spent in each phase of a callback.",
+    ("callback", "phase"),
+    LATENCY_BUCKETS,
+)
+request_bytes = Histogram(
+    "pyech_callback_request_bytes",
+    "Size of Dash callback request bodies.",
+    ("callback",),
+    SIZE_BUCKETS,
+)
+response_bytes = Histogram(
+    "pyech_callback_response_bytes",
+    "Size of Dash callback responses.",
+    ("callback",),
+    SIZE_BUCKETS,
+)
+transfer_bytes = Histogram(
+    "pyech_callback_transfer_bytes",
+    "Size of Dash callback responses as sent, after compression.",
+    ("callback", "encoding"),
+    SIZE_BUCKETS,
+)
+HISTOGRAMS = [callback_seconds, phase_seconds, request_bytes, response_bytes, transfer_bytes]
+
+_gauges: Dict[str, Callable[[], dict]] = {}
+_local = threading.local()
+
+
+def register_gauges(prefix: str, stats: Callable[[], dict]):
+    """Expose the numeric values returned by `stats()` as gauges named `prefix_<key>`."""
+    _gauges[prefix] = stats
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        callback = getattr(_local, "callback", None)
+        if callback is None:
+            phase_seconds.observe(elapsed, BACKGROUND, name)
+        else:
+            _local.phases[name] = _local.phases.get(name, 0.0) + elapsed
+
+
+def timed(name: str):
+    """Decorator recording every call of the wrapped function as phase `name`."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class Sampler:
+    """Samples the stack of one thread from a helper thread until stopped."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+class Profiler:
+    def __init__(self, slow: Optional[float], interval: float, directory: str):
+        self.slow = slow
+        self.interval = interval
+        self.directory = directory
+
+    @classmethod
+    def from_environment(cls) -> "Profiler":
+        slow = os.environ.get("PYECH_PROFILE_SLOW_MS")
+        return cls(
+            float(slow) / 1000 if slow else None,
+            float(os.environ.get("PYECH_PROFILE_INTERVAL_MS", 5)) / 1000,
+            os.environ.get("PYECH_PROFILE_DIR", "profiles"),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.slow is not None
+
+    def start(self) -> Optional[Sampler]:
+        if not self.enabled:
+            return None
+        return Sampler(threading.get_ident(), self.interval)
+
+    def finish(self, sampler: Optional[Sampler], callback: str, elapsed: float):
+        if sampler is None:
+            return
+        stacks = sampler.stop()
+        if elapsed < self.slow or not stacks:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(
+            self.directory, f"{callback}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}.folded"
+        )
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info("Callback %s took %.0f ms, stacks written to %s", callback, elapsed * 1000, path)
+
+
+profiler = Profiler.from_environment()
+
+
+def instrument_callback(name: str, func: Callable) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if has_request_context():
+            g.callback = name
+            if request.content_length is not None:
+                request_bytes.observe(request.content_length, name)
+        _local.callback = name
+        _local.phases = {}
+        sampler = profiler.start()
+        start = time.perf_counter()
+        try:
+            response = func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            phases = _local.phases
+            _local.callback = None
+            _local.phases = None
+            profiler.finish(sampler, name, elapsed)
+            callback_seconds.observe(elapsed, name)
+            for phase_name, seconds in phases.items():
+                phase_seconds.observe(seconds, name, phase_name)
+            phase_seconds.observe(max(elapsed - sum(phases.values()), 0.0), name, DISPATCH)
+        if isinstance(response, (str, bytes)):
+            response_bytes.observe(len(response), name)
+        return response
+
+    return wrapper
+
+
+def instrument(app):
+    """Wrap every server-side callback registered on `app` so far."""
+    for entry in app.callback_map.values():
+        func = entry.get("callback")
+        if func is None or getattr(func, "instrumented", False):
+            continue
+        entry["callback"] = instrument_callback(func.__name__, func)
+        entry["callback"].instrumented = True
+
+
+def render() -> str:
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for prefix, stats in _gauges.items():
+        for key, value in stats().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                name = f"pyech_{prefix}_{key}"
+                lines.extend([f"# TYPE {name} gauge", f"{name} {value}"])
+    return "\n".join(lines) + "\n"
+
+
+def register_route(server, path: str = "/metrics"):
+    @server.route(path)
+    def metrics():
+        return Response(render(), mimetype="text/plain; version=0.0.4")
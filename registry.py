@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from functools import partial
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, TYPE_CHECKING
+
+from cache import DOWNLOADING, PARSING, SurveyCache
+from columnstore import ColumnStore
+
+if TYPE_CHECKING:
+    from pyech import ECH
+
+
+QUEUED = "queued"
+READY = "ready"
+FAILED = "error"
+LOAD_STATUSES = (QUEUED, DOWNLOADING, PARSING, READY, FAILED)
+
+DEFAULT_MEMORY_BUDGET_MB = 4096
+DEFAULT_LOAD_WORKERS = 2
+
+
+def survey_nbytes(survey: ECH) -> int:
+    """Bytes of `survey` known when it is inserted; lazily loaded data is counted live."""
+    nbytes = survey.dictionary.memory_usage(index=True, deep=True).sum()
+    if not isinstance(survey.data, ColumnStore):
+        nbytes += survey.data.memory_usage(index=True, deep=True).sum()
+    return int(nbytes)
+
+
+class SurveyView(NamedTuple):
+    """A loaded year as summarized with `weights`, fixed when the view is taken.
+
+    Weights travel with the view and are passed to every aggregation explicitly, so no
+    session ever sets them on the shared survey. Derived structures are looked up for the
+    view's own survey: if the year is reloaded meanwhile, the view keeps serving the
+    survey and structures it started with.
+    """
+
+    registry: "SurveyRegistry"
+    year: int
+    survey: ECH
+    weights: Optional[str] = None
+
+    def derived(self, name: str, build: Callable[[ECH], object] = None):
+        return self.registry.derived(self.year, name, build, survey=self.survey)
+
+    def peek(self, name: str) -> Optional[object]:
+        return self.registry.peek(self.year, name, survey=self.survey)
+
+
+class SurveyRegistry:
+    """Loaded surveys keyed by year, evicted in LRU order when over `memory_budget` bytes.
+
+    The most recently inserted survey is never evicted, so a single year larger than the
+    budget can still be served. Data backed by a `ColumnStore` is charged as its columns
+    are materialized, and derived structures with an `on_grow` hook as they grow, and the
+    budget is enforced again after each one. Loads run on a
+    background executor with at most one load in flight per year; every caller asking for
+    that year shares the same future.
+
+    Loads, swaps, evictions and newly built derived structures are writers: they take the
+    lock and replace entries whole, never mutating a survey or structure in place. Readers
+    taking a view of a loaded year, or looking up a structure already built, take no lock;
+    each derived structure is stored with the survey it was built from, so a reader
+    holding a `SurveyView` never pairs a survey with another one's structures.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[..., ECH] = None,
+        memory_budget: int = None,
+        load_workers: int = None,
+    ):
+        if memory_budget is None:
+            memory_budget = (
+                int(os.environ.get("PYECH_MEMORY_BUDGET_MB", DEFAULT_MEMORY_BUDGET_MB))
+                * 2 ** 20
+            )
+        if load_workers is None:
+            load_workers = int(
+                os.environ.get("PYECH_LOAD_WORKERS", DEFAULT_LOAD_WORKERS)
+            )
+        self.loader = loader or SurveyCache().load
+        self.memory_budget = memory_budget
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._surveys = OrderedDict()
+        self._sizes: Dict[int, int] = {}
+        self._derived: Dict[tuple, tuple] = {}
+        self._builders: Dict[str, Callable[[ECH], object]] = {}
+        self._hooks: List[Callable[[int, ECH], object]] = []
+        self._inflight: Dict[int, Future] = {}
+        self._status: Dict[int, str] = {}
+        self._errors: Dict[int, BaseException] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=load_workers, thread_name_prefix="survey-load"
+        )
+
+    def __contains__(self, year) -> bool:
+        return int(year) in self._surveys
+
+    def get(self, year) -> ECH:
+        return self.submit(year).result()
+
+    def submit(self, year) -> Future:
+        year = int(year)
+        with self._lock:
+            if year in self._surveys:
+                self._surveys.move_to_end(year)
+                self.hits += 1
+                future = Future()
+                future.set_result(self._surveys[year])
+                return future
+            if year in self._inflight:
+                return self._inflight[year]
+            self.misses += 1
+            self._status[year] = QUEUED
+            self._errors.pop(year, None)
+            future = self._executor.submit(self._load, year)
+            self._inflight[year] = future
+            return future
+
+    def _load(self, year: int) -> ECH:
+        def progress(status):
+            self._status[year] = status
+
+        try:
+            survey = self.loader(year, progress=progress)
+            derived = {name: build(survey) for name, build in self._builders.items()}
+            self.put(year, survey, derived)
+        except BaseException as e:
+            self._status[year] = FAILED
+            self._errors[year] = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(year, None)
+        for hook in self._hooks:
+            hook(year, survey)
+        return survey
+
+    def register(self, name: str, build: Callable[[ECH], object]):
+        """Build `name` for every survey as part of its load, before it is reported ready."""
+        self._builders[name] = build
+
+    def on_ready(self, hook: Callable[[int, ECH], object]):
+        """Call `hook(year, survey)` in the load thread once a year is reported ready."""
+        self._hooks.append(hook)
+
+    def view(self, year, weights: str = None) -> SurveyView:
+        """Snapshot of the survey of `year` to summarize with `weights`, loading it if needed."""
+        year = int(year)
+        survey = self._surveys.get(year)
+        if survey is None:
+            survey = self.get(year)
+        else:
+            # Single dict operations are atomic, so a hit needs no lock; a concurrent
+            # eviction just makes the recency update a no-op.
+            try:
+                self._surveys.move_to_end(year)
+            except KeyError:
+                pass
+            self.hits += 1
+        if weights is not None and weights not in survey.data.columns:
+            raise KeyError(f"Unknown weights for {year}: {weights!r}")
+        return SurveyView(self, year, survey, weights)
+
+    def peek(self, year, name: str, survey: ECH = None) -> Optional[object]:
+        """Derived structure `name` of `year` if it is already built, without building it.
+
+        With `survey`, only a structure built from that survey is returned.
+        """
+        entry = self._derived.get((int(year), name))
+        if entry is None or (survey is not None and entry[0] is not survey):
+            return None
+        return entry[1]
+
+    def derived(
+        self, year, name: str, build: Callable[[ECH], object] = None, survey: ECH = None
+    ):
+        """Structure built once from the survey of `year` and dropped when it is evicted.
+
+        Its `nbytes` attribute, if any, counts towards the memory budget, and so does what
+        it later reports to its `on_grow` attribute, if any. With `survey`, the structure
+        is the one built from that survey; if the year has been reloaded since, it is
+        built again and returned without being kept.
+        """
+        year = int(year)
+        key = (year, name)
+        entry = self._derived.get(key)
+        if entry is not None and (survey is None or entry[0] is survey):
+            return entry[1]
+        build = build or self._builders[name]
+        if survey is None:
+            survey = self.get(year)
+        value = build(survey)
+        with self._lock:
+            if self._surveys.get(year) is not survey:
+                return value
+            entry = self._derived.get(key)
+            if entry is None:
+                self._derived[key] = (survey, value)
+                self._sizes[year] += getattr(value, "nbytes", 0)
+                self._charge_growth(key, value)
+                self._evict()
+                return value
+            return entry[1]
+
+    def status(self, year) -> str:
+        year = int(year)
+        if year in self._surveys:
+            return READY
+        return self._status.get(year)
+
+    def error(self, year) -> BaseException:
+        return self._errors.get(int(year))
+
+    def put(self, year, survey: ECH, derived: Dict[str, object] = None):
+        year = int(year)
+        derived = derived or {}
+        if isinstance(survey.data, ColumnStore):
+            survey.data.on_materialize = self._enforce_budget
+        nbytes = survey_nbytes(survey) + sum(
+            getattr(value, "nbytes", 0) for value in derived.values()
+        )
+        with self._lock:
+            self._surveys[year] = survey
+            self._surveys.move_to_end(year)
+            self._sizes[year] = nbytes
+            for key in [key for key in self._derived if key[0] == year]:
+                del self._derived[key]
+            for name, value in derived.items():
+                self._derived[(year, name)] = (survey, value)
+                self._charge_growth((year, name), value)
+            self._status[year] = READY
+            self._evict()
+
+    def _enforce_budget(self):
+        with self._lock:
+            self._evict()
+
+    def _charge_growth(self, key: tuple, value):
+        if hasattr(value, "on_grow"):
+            value.on_grow = partial(self._grow, key, value)
+
+    def _grow(self, key: tuple, value, nbytes: int):
+        with self._lock:
+            # Structures since evicted or replaced are no longer counted.
+            entry = self._derived.get(key)
+            if entry is not None and entry[1] is value:
+                self._sizes[key[0]] += nbytes
+                self._evict()
+
+    def _evict(self):
+        while len(self._surveys) > 1 and self.nbytes > self.memory_budget:
+            year, _ = self._surveys.popitem(last=False)
+            del self._sizes[year]
+            for key in [key for key in self._derived if key[0] == year]:
+                del self._derived[key]
+            self._status.pop(year, None)
+            self.evictions += 1
+
+    @property
+    def nbytes(self) -> int:
+        lazy = sum(
+            survey.data.nbytes
+            for survey in list(self._surveys.values())
+            if isinstance(survey.data, ColumnStore)
+        )
+        return sum(self._sizes.values()) + lazy
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "years": list(self._surveys),
+                "loading": {year: self._status.get(year) for year in self._inflight},
+                "nbytes": self.nbytes,
+                "memory_budget": self.memory_budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
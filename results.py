@@ -0,0 +1,317 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from bitmaps import Filter
+from cache import pyech_revision, read_arrow, write_arrow
+
+
+DEFAULT_RESULT_CACHE_MB = 256
+DEFAULT_RESULT_DISK_MB = 1024
+DEFAULT_RESULT_STORE_MB = 256
+
+
+def frame_nbytes(frame: pd.DataFrame) -> int:
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+def frame_records(frame: pd.DataFrame) -> List[dict]:
+    """`frame` as a list of records of plain Python values, with NaN as None.
+
+    Columns are converted whole with ``tolist``, which keeps every float exactly and is
+    several times faster than ``to_dict("records")``; the records leave nothing for the
+    JSON encoder to special-case.
+    """
+    names = [str(name) for name in frame.columns]
+    columns = []
+    for _, column in frame.items():
+        values = column.tolist()
+        for i in np.flatnonzero(column.isna().to_numpy()):
+            values[i] = None
+        columns.append(values)
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def prune(directory: str, suffix: str, max_bytes: int):
+    """Delete the least recently used `suffix` files of `directory` beyond `max_bytes`.
+
+    Files are ranked by modification time, which readers refresh on every hit. Workers
+    sharing the directory may prune concurrently, so files can vanish at any point.
+    """
+    files = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(suffix):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def touch(path: str):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+class SummarySpec(NamedTuple):
+    year: int
+    weights: str
+    sumvar: str
+    by: Tuple[str, ...]
+    aggfunc: str
+    is_categorical: Optional[bool]
+    household_level: bool
+    errors: bool = False
+    where: Optional[Filter] = None
+
+    @classmethod
+    def create(
+        cls,
+        year,
+        weights,
+        sumvar,
+        by,
+        aggfunc,
+        is_categorical,
+        household_level,
+        errors=False,
+        where=None,
+    ) -> "SummarySpec":
+        if isinstance(by, str):
+            by = [by]
+        return cls(
+            int(year),
+            weights,
+            sumvar,
+            tuple(by or ()),
+            aggfunc,
+            is_categorical,
+            bool(household_level),
+            bool(errors),
+            Filter.create(where),
+        )
+
+    @property
+    def handle(self) -> str:
+        return hashlib.sha1(repr(self).encode()).hexdigest()
+
+    def series_handle(self, years) -> str:
+        return hashlib.sha1(repr((self, tuple(years))).encode()).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe mapping bounded by the total size of its values, in bytes."""
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[object], int] = frame_nbytes):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key) -> bool:
+        return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        nbytes = self.sizeof(value)
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= self._items.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            self._items[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._items),
+            "nbytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SummaryCache:
+    """Summaries keyed by `SummarySpec`, in memory and optionally pickled to `directory`.
+
+    The directory is kept under `max_disk_bytes` by deleting the least recently used
+    pickles. Unreadable pickles, such as ones left by a crashed write, count as misses.
+
+    Grouper order is part of the key: the order of a summary's rows follows the category
+    codes of its groupers, which the labelled result no longer carries. A reordered
+    request is rolled up from the engine's kept partials instead.
+    """
+
+    def __init__(
+        self, max_bytes: int = None, directory: str = None, max_disk_bytes: int = None
+    ):
+        if max_bytes is None:
+            max_bytes = (
+                int(os.environ.get("PYECH_RESULT_CACHE_MB", DEFAULT_RESULT_CACHE_MB))
+                * 2 ** 20
+            )
+        if max_disk_bytes is None:
+            max_disk_bytes = (
+                int(os.environ.get("PYECH_RESULT_CACHE_DISK_MB", DEFAULT_RESULT_DISK_MB))
+                * 2 ** 20
+            )
+        directory = directory or os.environ.get("PYECH_RESULT_CACHE_DIR")
+        if directory:
+            directory = os.path.join(directory, pyech_revision()[:12])
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = LRUCache(max_bytes)
+        self.disk_hits = 0
+
+    def _path(self, spec: SummarySpec) -> str:
+        return os.path.join(self.directory, f"{spec.handle}.pkl")
+
+    def get(self, spec: SummarySpec) -> Optional[pd.DataFrame]:
+        summary = self.memory.get(spec)
+        if summary is None and self.directory:
+            try:
+                with open(self._path(spec), "rb") as f:
+                    summary = pickle.load(f)
+            except FileNotFoundError:
+                return None
+            except Exception:
+                # A truncated or otherwise corrupt pickle can fail in many ways.
+                try:
+                    os.remove(self._path(spec))
+                except OSError:
+                    pass
+                return None
+            touch(self._path(spec))
+            self.disk_hits += 1
+            self.memory.put(spec, summary)
+        return summary
+
+    def put(self, spec: SummarySpec, summary: pd.DataFrame):
+        self.memory.put(spec, summary)
+        if self.directory:
+            path = self._path(spec)
+            tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(summary, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            prune(self.directory, ".pkl", self.max_disk_bytes)
+
+    def get_or_compute(
+        self, spec: SummarySpec, compute: Callable[[], pd.DataFrame]
+    ) -> pd.DataFrame:
+        summary = self.get(spec)
+        if summary is None:
+            summary = compute()
+            self.put(spec, summary)
+        return summary
+
+    def stats(self) -> dict:
+        stats = self.memory.stats()
+        stats["disk_hits"] = self.disk_hits
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + self.disk_hits) / lookups if lookups else 0.0
+        return stats
+
+
+class ResultStore:
+    """DataFrames addressed by opaque handles.
+
+    Frames are kept in a memory LRU shared by the threads of this process. When `directory`
+    is set they are also written there as Arrow files, so that any gunicorn worker can
+    resolve a handle issued by another one. The directory usually lives in an in-memory
+    /tmp, so it is kept under `max_disk_bytes` by deleting the least recently used files;
+    a handle whose file is gone resolves to None, like an unknown one.
+    """
+
+    handle_pattern = re.compile(r"^[0-9a-f]{40}$")
+
+    def __init__(
+        self, max_bytes: int = None, directory: str = None, max_disk_bytes: int = None
+    ):
+        if max_bytes is None:
+            max_bytes = (
+                int(os.environ.get("PYECH_RESULT_CACHE_MB", DEFAULT_RESULT_CACHE_MB))
+                * 2 ** 20
+            )
+        if max_disk_bytes is None:
+            max_disk_bytes = (
+                int(os.environ.get("PYECH_RESULT_STORE_MB", DEFAULT_RESULT_STORE_MB))
+                * 2 ** 20
+            )
+        directory = directory or os.environ.get("PYECH_RESULT_STORE_DIR")
+        if directory:
+            directory = os.path.join(directory, pyech_revision()[:12])
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = LRUCache(max_bytes)
+
+    def _path(self, handle: str) -> str:
+        return os.path.join(self.directory, f"{handle}.arrow")
+
+    def put(self, handle: str, frame: pd.DataFrame) -> str:
+        self.memory.put(handle, frame)
+        if self.directory:
+            if os.path.exists(self._path(handle)):
+                touch(self._path(handle))
+            else:
+                write_arrow(frame, self._path(handle))
+                prune(self.directory, ".arrow", self.max_disk_bytes)
+        return handle
+
+    def get(self, handle: str) -> Optional[pd.DataFrame]:
+        if not handle or not self.handle_pattern.match(handle):
+            return None
+        frame = self.memory.get(handle)
+        if frame is None and self.directory:
+            try:
+                frame = read_arrow(self._path(handle))
+            except (OSError, ValueError):
+                return None
+            touch(self._path(handle))
+            self.memory.put(handle, frame)
+        return frame
@@ -0,0 +1,96 @@
+"""Measure how long a cold worker takes to answer its first requests.
+
+    python startup.py [--target-ms 1500] [--top 20]
+
+Imports the app in a fresh interpreter with ``-X importtime`` and reports the slowest
+top-level imports. Then, in another fresh interpreter, it times importing the app and
+serving ``/``, ``/_dash-layout`` and ``/_dash-dependencies`` through the Flask test
+client. The run fails when the time to the first response exceeds the target.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TARGET_MS = 1500
+FIRST_RESPONSE = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.server.test_client()
+timings = {"import": imported - start}
+for path in ("/", "/_dash-layout", "/_dash-dependencies"):
+    response = client.get(path)
+    assert response.status_code == 200, (path, response.status_code)
+    timings[path] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+def import_times() -> List[Tuple[str, float, float]]:
+    """`(package, self seconds, cumulative seconds)` of every top-level package."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    own: Dict[str, float] = defaultdict(float)
+    cumulative: Dict[str, float] = defaultdict(float)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        package = name.strip().split(".")[0]
+        own[package] += int(self_us) / 1e6
+        if name.strip() == package:
+            cumulative[package] = max(cumulative[package], int(cumulative_us) / 1e6)
+    return sorted(
+        ((p, own[p], cumulative[p]) for p in own), key=lambda item: item[2], reverse=True
+    )
+
+
+def first_response() -> Dict[str, float]:
+    result = subprocess.run(
+        [sys.executable, "-c", FIRST_RESPONSE],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report cold start times of the app.")
+    parser.add_argument(
+        "--target-ms",
+        type=float,
+        default=float(os.environ.get("PYECH_STARTUP_TARGET_MS", DEFAULT_TARGET_MS)),
+    )
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'package':<32} {'self':>9} {'cumulative':>11}")
+    for package, own, cumulative in import_times()[: args.top]:
+        print(f"{package:<32} {own * 1000:>7.0f}ms {cumulative * 1000:>9.0f}ms")
+
+    timings = first_response()
+    print()
+    for step, seconds in timings.items():
+        print(f"{step:<32} {seconds * 1000:>9.0f}ms")
+    elapsed = timings["/"] * 1000
+    print(f"\nTime to first response: {elapsed:.0f}ms (target {args.target_ms:.0f}ms)")
+    if elapsed > args.target_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import copy
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+
+# Keep the on-disk caches of the tests away from the real ones.
+os.environ["PYECH_CACHE_DIR"] = tempfile.mkdtemp(prefix="pyech-tests-")
+os.environ.pop("PYECH_RESULT_CACHE_DIR", None)
+os.environ.pop("PYECH_RESULT_STORE_DIR", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import make_survey  # noqa: E402
+from engine import AggregationEngine  # noqa: E402
+
+
+YEAR = 2019
+
+
+@pytest.fixture(scope="session")
+def survey():
+    survey = make_survey(YEAR, households=300, extra_columns=4)
+    survey.weights = "pesoano"
+    return survey
+
+
+@pytest.fixture(scope="session")
+def engine(survey):
+    return AggregationEngine(survey)
+
+
+@pytest.fixture(scope="session")
+def partially_labelled(survey):
+    """The survey with labels for only some departments."""
+    partial = copy.copy(survey)
+    labels = dict(survey.metadata.variable_value_labels)
+    labels["dpto"] = {k: v for k, v in labels["dpto"].items() if k <= 5}
+    partial.metadata = SimpleNamespace(**{**vars(survey.metadata), "variable_value_labels": labels})
+    return partial
@@ -0,0 +1,33 @@
+import orjson
+import pyarrow as pa
+import pytest
+
+from api import arrow_stream, ndjson_line
+from engine import AggregationEngine
+from results import SummarySpec
+
+
+@pytest.fixture(scope="module")
+def summary(partially_labelled):
+    return AggregationEngine(partially_labelled).summarize("ht11", ["dpto"], weights="pesoano")
+
+
+SPEC = SummarySpec.create(2019, "pesoano", "ht11", ["dpto"], "mean", False, False)
+
+
+def test_ndjson_keeps_partially_labelled_groups_and_exact_values(summary):
+    line = orjson.loads(ndjson_line(0, SPEC, summary, None))
+    assert [r["dpto"] for r in line["data"]] == summary["dpto"].tolist()
+    assert [r["ht11"] for r in line["data"]] == summary["ht11"].tolist()
+
+
+@pytest.mark.parametrize("labels", ["engine", "mixed"])
+def test_arrow_keeps_partially_labelled_groups(summary, labels):
+    if labels == "mixed":
+        mixed = [19.0 if i % 2 else "Montevideo" for i in range(len(summary))]
+        summary = summary.assign(dpto=mixed)
+    table = pa.ipc.open_stream(arrow_stream(0, SPEC, summary, None)).read_all()
+    assert table.schema.field("dpto").type == pa.string()
+    expected = summary["dpto"].map(lambda v: v if isinstance(v, str) else str(v))
+    assert table.column("dpto").to_pylist() == expected.tolist()
+    assert table.column("ht11").to_pylist() == summary["ht11"].tolist()
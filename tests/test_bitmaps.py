@@ -0,0 +1,44 @@
+import numpy as np
+
+from bitmaps import Filter, indexed_columns
+from cache import SurveyCache
+from engine import AggregationEngine
+from households import load_households
+from registry import SurveyRegistry
+
+
+def where(variable, values):
+    return Filter.create({"conditions": [{"variable": variable, "values": values}]})
+
+
+def test_columns_over_the_cap_are_filtered_by_their_codes(survey, monkeypatch):
+    monkeypatch.setenv("PYECH_BITMAP_MAX_VALUES", "5")
+    engine = AggregationEngine(survey)
+    assert "e26" in engine.bitmaps._bitmaps
+    assert "dpto" not in engine.bitmaps._bitmaps
+    mask = engine.mask(where("dpto", [1, 3]))
+    np.testing.assert_array_equal(mask, survey.data["dpto"].isin([1, 3]).to_numpy())
+    assert "dpto" not in engine.bitmaps._bitmaps
+
+
+def test_lazy_loads_index_only_the_configured_columns(survey):
+    SurveyCache().write(2019, survey)
+    lazy = SurveyCache().read(2019, lazy=True)
+    engine = AggregationEngine(lazy, precompute=False, households=load_households(lazy))
+    assert set(engine.bitmaps._bitmaps) == set(indexed_columns())
+    assert not {"c2", "e49", "pt1"} & set(lazy.data.materialized)
+
+
+def test_structures_built_on_demand_are_charged_to_the_registry(survey):
+    engine = AggregationEngine(survey, precompute=False)
+    registry = SurveyRegistry(loader=lambda year, progress=None: survey)
+    registry.put(2019, survey, {"engine": engine})
+    before, engine_before = registry.nbytes, engine.nbytes
+    engine.mask(where("c2", [1]))
+    assert "c2" in engine.bitmaps._bitmaps
+    assert registry.nbytes - before == engine.nbytes - engine_before > 0
+    # Once the year is replaced, the old engine's growth is not charged.
+    registry.put(2019, survey, {})
+    before = registry.nbytes
+    engine.mask(where("e49", [1]))
+    assert registry.nbytes == before
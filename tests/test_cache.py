@@ -0,0 +1,54 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import cache
+from cache import SurveyCache
+
+
+@pytest.fixture
+def fetched(survey, monkeypatch, tmp_path):
+    """Years fetched from the survey repository, which is replaced by `survey`."""
+    years = []
+
+    def fetch(year):
+        years.append(year)
+        time.sleep(0.05)
+        return survey
+
+    monkeypatch.setenv("PYECH_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("PYECH_COMPACT", "0")
+    monkeypatch.setattr(cache, "fetch_survey", fetch)
+    return years
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_written_surveys_read_back_unchanged(survey, tmp_path, lazy):
+    surveys = SurveyCache(str(tmp_path))
+    surveys.write(2019, survey)
+    read = surveys.read(2019, lazy=lazy)
+    data = read.data.to_frame() if lazy else read.data
+    pd.testing.assert_frame_equal(data, survey.data.reset_index(drop=True))
+    pd.testing.assert_frame_equal(read.dictionary, survey.dictionary.reset_index(drop=True))
+    assert read.metadata.variable_value_labels == survey.metadata.variable_value_labels
+    assert read.weights is None
+
+
+def test_a_new_pyech_revision_rebuilds_the_cache(fetched, monkeypatch):
+    SurveyCache().load(2019)
+    SurveyCache().load(2019)
+    assert fetched == [2019]
+    monkeypatch.setattr(cache, "pyech_revision", lambda: "another revision")
+    SurveyCache().load(2019)
+    assert fetched == [2019, 2019]
+
+
+def test_concurrent_loads_fetch_once(fetched):
+    threads = [threading.Thread(target=SurveyCache().load, args=(2019,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fetched == [2019]
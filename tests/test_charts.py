@@ -0,0 +1,82 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from charts import OTHERS, collapse, collapse_limits
+from engine import ERROR_COLUMNS
+
+
+@pytest.fixture
+def frame():
+    """Sums by department and sex, with departments from largest to smallest."""
+    departments = ["Montevideo", "Canelones", "Maldonado", "Salto", "Flores"]
+    return pd.DataFrame(
+        {
+            "dpto": np.repeat(departments, 2),
+            "e26": ["Hombre", "Mujer"] * 5,
+            "ht11": [50.0, 40.0, 30.0, 25.0, 12.0, 8.0, 4.0, 3.0, 2.0, 1.0],
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "cardinalities, top, bars, limits",
+    [
+        ({"dpto": 19, "e26": 2}, 25, 2000, {}),
+        # At the limit values are kept; one past it, the rest are merged.
+        ({"dpto": 25, "e26": 2}, 25, 2000, {}),
+        ({"dpto": 26, "e26": 2}, 25, 2000, {"dpto": 25}),
+        ({"dpto": 19, "e26": 2}, 25, 38, {}),
+        ({"dpto": 19, "e26": 2}, 25, 30, {"dpto": 14}),
+        ({"a": 10, "b": 10}, 25, 50, {"a": 6, "b": 6}),
+        # Groupers are never collapsed below one value and "Otros".
+        ({"a": 3, "b": 3}, 25, 1, {"a": 1, "b": 1}),
+    ],
+)
+def test_collapse_limits(cardinalities, top, bars, limits):
+    assert collapse_limits(cardinalities, top, bars) == limits
+
+
+def test_collapse_limits_bound_the_bars():
+    cardinalities = {"a": 200, "b": 40, "c": 7}
+    limits = collapse_limits(cardinalities, 25, 2000)
+    sizes = [limits[c] + 1 if c in limits else n for c, n in cardinalities.items()]
+    assert math.prod(sizes) <= 2000
+
+
+@pytest.mark.parametrize("keep", [5, 6])
+def test_collapse_keeps_every_value_within_the_limit(frame, keep):
+    pd.testing.assert_frame_equal(collapse(frame, {"dpto": keep}, "ht11"), frame)
+
+
+def test_collapse_merges_the_smallest_values(frame):
+    collapsed = collapse(frame, {"dpto": 3}, "ht11")
+    assert list(collapsed["dpto"].unique()) == ["Montevideo", "Canelones", "Maldonado", OTHERS]
+    others = collapsed[collapsed["dpto"] == OTHERS].set_index("e26")["ht11"]
+    assert others.to_dict() == {"Hombre": 6.0, "Mujer": 4.0}
+    assert collapsed["ht11"].sum() == frame["ht11"].sum()
+
+
+def test_collapse_can_merge_every_value(frame):
+    collapsed = collapse(frame, {"dpto": 0, "e26": 0}, "ht11")
+    assert collapsed.to_dict("records") == [
+        {"dpto": OTHERS, "e26": OTHERS, "ht11": frame["ht11"].sum()}
+    ]
+
+
+def test_collapse_weights_merged_means_and_empties_their_errors(frame):
+    means = frame.assign(**{ERROR_COLUMNS[0]: 1.0})
+    weights = frame.assign(ht11=[1.0, 3.0] * 5)
+    collapsed = collapse(means, {"dpto": 3}, "ht11", weights)
+    others = collapsed[collapsed["dpto"] == OTHERS].set_index("e26")
+    assert others["ht11"].to_dict() == {"Hombre": 3.0, "Mujer": 2.0}
+    assert others[ERROR_COLUMNS[0]].isna().all()
+    kept = collapsed[collapsed["dpto"] != OTHERS]
+    assert (kept[ERROR_COLUMNS[0]] == 1.0).all()
+    # The weighted total of the merged groups is preserved.
+    merged = ~frame["dpto"].isin(kept["dpto"])
+    total = (frame["ht11"] * weights["ht11"])[merged].sum()
+    merged_weights = weights[merged].groupby("e26")["ht11"].sum()
+    assert (others["ht11"] * merged_weights).sum() == total
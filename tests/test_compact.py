@@ -0,0 +1,15 @@
+import pandas as pd
+
+from compact import compact_column
+
+
+def test_dates_and_durations_keep_their_dtype():
+    dates = pd.Series(pd.date_range("2019-01-01", periods=4), name="fecha")
+    durations = dates - dates.iloc[0]
+    for column in (dates, durations):
+        assert compact_column(column, False, 10).dtype == column.dtype
+
+
+def test_integers_are_downcast():
+    column = pd.Series([1, 2, 3], dtype="int64", name="e26")
+    assert compact_column(column, False, 10).dtype == "int8"
@@ -0,0 +1,47 @@
+import os
+
+import pandas as pd
+import pytest
+
+from cache import SurveyCache
+from cube import Cube
+from engine import AggregationEngine, VERIFY_RTOL
+
+
+def test_build_reads_only_the_configured_columns(survey):
+    SurveyCache().write(2019, survey)
+    lazy = SurveyCache().read(2019, lazy=True)
+    engine = AggregationEngine(lazy, precompute=False)
+    cube = Cube.build(engine, [("dpto",)], ["ht11", "dpto", "missing"])
+    assert cube.lookup("ht11", ["dpto"], "pesoano", False) is not None
+    assert cube.lookup("pt1", ["dpto"], "pesoano", False) is None
+    assert len(lazy.data.materialized) < 10
+    assert "pt1" not in lazy.data.materialized
+
+
+@pytest.mark.parametrize("variable", ["ht11", "pt1", "e27"])
+@pytest.mark.parametrize("aggfunc", ["mean", "sum", "count"])
+@pytest.mark.parametrize("by, household_level", [(["e26", "dpto"], False), (["dpto"], True)])
+def test_lookups_match_summaries(survey, engine, variable, aggfunc, by, household_level):
+    cube = Cube.build(engine, [("dpto",), ("dpto", "e26")], [variable])
+    kwargs = dict(aggfunc=aggfunc, household_level=household_level, weights="pesoano")
+    assert cube.lookup(variable, by, "pesoano", household_level) is not None
+    pd.testing.assert_frame_equal(
+        engine.summarize(variable, by, cube=cube, **kwargs),
+        AggregationEngine(survey).summarize(variable, by, **kwargs),
+        check_dtype=False,
+        rtol=VERIFY_RTOL,
+        atol=0,
+    )
+
+
+def test_persisted_cells_are_rebuilt_when_the_variables_change(engine, tmp_path):
+    directory = str(tmp_path)
+    Cube.build(engine, [("dpto",)], ["ht11"], directory)
+    cells = len(os.listdir(directory))
+    cube = Cube.build(engine, [("dpto",)], ["ht11", "pt1"], directory)
+    assert cube.lookup("pt1", ["dpto"], "pesoano", False) is not None
+    # The cells of the former variables are replaced, not kept alongside.
+    assert len(os.listdir(directory)) == cells
+    reused = Cube.build(engine, [("dpto",)], ["pt1", "ht11"], directory)
+    assert reused.lookup("pt1", ["dpto"], "pesoano", False) is not None
@@ -0,0 +1,66 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dictionary import DictionaryIndex, normalize, query_table
+
+
+@pytest.fixture(scope="module")
+def index(survey):
+    return DictionaryIndex(survey.dictionary)
+
+
+def contains(frame: pd.DataFrame, pattern: str) -> np.ndarray:
+    """Rows the old `str.contains` filter keeps for `pattern`, on accent-free text."""
+    matches = np.zeros(len(frame), dtype=bool)
+    for column in frame.columns:
+        text = frame[column].map(normalize, na_action="ignore")
+        matches |= text.str.contains(pattern, na=False).to_numpy()
+    return np.flatnonzero(matches)
+
+
+def starts_a_word(frame: pd.DataFrame, *terms: str) -> np.ndarray:
+    """Rows where every term begins a word, which is what the index matches."""
+    rows = [set(contains(frame, r"\b" + re.escape(normalize(t)))) for t in terms]
+    return np.array(sorted(set.intersection(*rows)), dtype=int)
+
+
+@pytest.mark.parametrize("term", ["ponderador", "pond", "Monte", "hogar", "e2"])
+def test_prefixes_match_word_starts(index, term):
+    rows = index.search(term)
+    np.testing.assert_array_equal(rows, starts_a_word(index.frame, term))
+    assert set(rows) <= set(contains(index.frame, re.escape(normalize(term))))
+
+
+def test_whole_words_match_the_old_filter(index):
+    np.testing.assert_array_equal(index.search("Ponderador"), contains(index.frame, "ponderador"))
+
+
+def test_every_term_must_match(index):
+    rows = index.search("ponderador anual")
+    np.testing.assert_array_equal(rows, starts_a_word(index.frame, "ponderador", "anual"))
+    assert index.frame.loc[rows, "Nombre"].tolist() == ["pesoano"]
+
+
+def test_accents_and_case_are_ignored(index):
+    np.testing.assert_array_equal(index.search("REGIÓN"), index.search("region"))
+    np.testing.assert_array_equal(index.search("Año"), index.search("ano"))
+    assert "region_4" in index.frame.loc[index.search("región"), "Nombre"].tolist()
+
+
+@pytest.mark.parametrize("term", [None, "", "   ", "¿?"])
+def test_empty_queries_keep_every_row(index, term):
+    np.testing.assert_array_equal(index.search(term), np.arange(len(index.frame)))
+
+
+def test_query_table_filters_and_sorts(index):
+    frame = query_table(
+        index.frame,
+        '{Descripción} contains "region" && {Nombre} ne "dpto"',
+        [{"column_id": "Nombre", "direction": "desc"}],
+    )
+    assert frame["Nombre"].tolist() == ["region_4"]
+    frame = query_table(index.frame, "", [{"column_id": "Nombre", "direction": "asc"}])
+    assert frame["Nombre"].tolist() == sorted(index.frame["Nombre"])
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bitmaps import Filter
+from engine import ERROR_COLUMNS, Z_95, AggregationEngine, VERIFY_RTOL, verify
+
+from benchmarks.synthetic import make_survey
+
+
+def test_partially_labelled_grouper_has_text_labels(partially_labelled):
+    engine = AggregationEngine(partially_labelled)
+    summary = engine.summarize("ht11", ["dpto"], weights="pesoano")
+    assert summary["dpto"].map(type).eq(str).all()
+    assert "Montevideo" in set(summary["dpto"])
+    assert "19" in set(summary["dpto"])
+
+
+@pytest.mark.parametrize(
+    "variable, by, kwargs",
+    [
+        ("ht11", ["dpto"], {}),
+        ("ht11", ["dpto"], {"household_level": True}),
+        ("pt1", ["e26", "region_4"], {"aggfunc": "sum"}),
+        ("pobpcoac", ["e26"], {"aggfunc": "count"}),
+        ("e27", None, {"household_level": True}),
+        # e49 and c2 are missing for some people and households, pt1 for some people.
+        ("ht11", ["e49"], {}),
+        ("ht11", ["c2", "e26"], {"household_level": True}),
+        ("e27", ["e49", "c2"], {"aggfunc": "sum"}),
+        ("pt1", ["dpto"], {}),
+        ("pt1", ["e49"], {"aggfunc": "sum"}),
+        ("pt1", ["e49"], {"aggfunc": "count"}),
+        ("pt1", None, {}),
+        ("pt1", None, {"aggfunc": "count"}),
+        ("e49", ["c2"], {"aggfunc": "count"}),
+        ("c2", None, {"household_level": True, "aggfunc": "count"}),
+    ],
+)
+@pytest.mark.parametrize("scale", [1, 1.1])
+def test_summaries_match_pyech(variable, by, kwargs, scale):
+    survey = make_survey(2019, households=300, extra_columns=0)
+    survey.data["pesoano"] = survey.data["pesoano"] * scale
+    survey.weights = "pesoano"
+    survey.splitter = []
+    verify(survey, AggregationEngine(survey), variable, by, **kwargs)
+
+
+@pytest.mark.parametrize("variable", ["ht11", "ht19", "pt1"])
+@pytest.mark.parametrize("scale", [1, 1.1])
+def test_rolled_up_summaries_match_direct_ones(variable, scale):
+    survey = make_survey(2019, households=300, extra_columns=0)
+    survey.data["pesoano"] = survey.data["pesoano"] * scale
+    engine = AggregationEngine(survey)
+    finest = ["dpto", "e26", "pobpcoac", "e49"]
+    engine.summarize(variable, finest, weights="pesoano")
+    for by in (["e26", "pobpcoac", "dpto"], ["dpto", "e26"], ["dpto"], [], []):
+        rolled_up = engine.summarize(variable, by, weights="pesoano")
+        direct = AggregationEngine(survey).summarize(variable, by, weights="pesoano")
+        pd.testing.assert_frame_equal(rolled_up, direct, check_exact=True)
+
+
+def brute_force_errors(survey, variable, by, aggfunc, household_level, where):
+    """Estimate and linearized standard error of every group, one household at a time.
+
+    Households are the sampling units, sampled with replacement; every household of the
+    sample counts, including those without rows in the group.
+    """
+    data = survey.data[survey.data["nper"] == 1] if household_level else survey.data
+    households = survey.data["numero"].nunique()
+    if where is not None:
+        data = data[data[where[0]].isin(where[1])]
+    groups = data.groupby(by, dropna=False, sort=True) if by else [(None, data)]
+    rows = []
+    for _, group in groups:
+        w, x = group["pesoano"], group[variable]
+        if aggfunc == "count":
+            estimate, z = w.sum(), w
+        elif x.isna().any():
+            rows.append((np.nan, np.nan))
+            continue
+        else:
+            estimate = np.average(x, weights=w)
+            z = w * (x - estimate) / w.sum()
+        totals = z.groupby(group["numero"]).sum().reindex(
+            survey.data["numero"].unique(), fill_value=0
+        )
+        variance = households / (households - 1) * ((totals - totals.mean()) ** 2).sum()
+        rows.append((estimate, np.sqrt(variance)))
+    return pd.DataFrame(rows, columns=["estimate", "se"])
+
+
+@pytest.mark.parametrize(
+    "variable, by, aggfunc, household_level",
+    [
+        ("pt1", ["dpto", "e26"], "mean", False),
+        ("pt1", ["e49"], "mean", False),
+        ("pt1", ["e49"], "count", False),
+        ("e27", None, "mean", False),
+        ("ht11", ["dpto"], "mean", True),
+        ("ht11", ["region_4", "c2"], "count", True),
+    ],
+)
+@pytest.mark.parametrize("where", [None, ("e26", [2])])
+def test_errors_match_a_per_household_computation(
+    survey, engine, variable, by, aggfunc, household_level, where
+):
+    if household_level and where is not None:
+        where = ("region_4", [1, 2])
+    result = engine.summarize(
+        variable,
+        by,
+        aggfunc=aggfunc,
+        household_level=household_level,
+        weights="pesoano",
+        errors=True,
+        where=where and Filter.create({"conditions": [{"variable": where[0], "values": where[1]}]}),
+    )
+    expected = brute_force_errors(survey, variable, by, aggfunc, household_level, where)
+    assert len(result) == len(expected)
+    error, lower, upper, cv = ERROR_COLUMNS
+    se = expected["se"]
+    estimate = expected["estimate"]
+    for column, values in [
+        (variable, estimate),
+        (error, se),
+        (lower, estimate - Z_95 * se),
+        (upper, estimate + Z_95 * se),
+        (cv, se / estimate.abs()),
+    ]:
+        np.testing.assert_allclose(result[column], values, rtol=1e-9, err_msg=column)
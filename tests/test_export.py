@@ -0,0 +1,55 @@
+import io
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from flask import Flask
+
+from export import create_blueprint, frame_chunks, parquet_chunks
+
+
+class Registry:
+    """Serves `survey` for every year and records the years asked for."""
+
+    def __init__(self, survey):
+        self.survey = survey
+        self.years = []
+
+    def get(self, year):
+        self.years.append(year)
+        return self.survey
+
+
+@pytest.fixture
+def client(survey):
+    server = Flask(__name__)
+    registry = Registry(survey)
+    server.register_blueprint(create_blueprint(registry, lambda handle: None))
+    client = server.test_client()
+    client.registry = registry
+    return client
+
+
+def test_parquet_chunks_start_with_missing_values():
+    frame = pd.DataFrame(
+        {"nombre": [None, None, "a", "b"], "x": [float("nan"), float("nan"), 1.5, 2.5]}
+    )
+    data = b"".join(parquet_chunks(frame_chunks(frame, 2)))
+    table = pq.read_table(io.BytesIO(data))
+    assert table.column("nombre").to_pylist() == [None, None, "a", "b"]
+    assert table.column("x").to_pylist()[2:] == [1.5, 2.5]
+
+
+def test_microdata_of_an_available_year(client, survey):
+    response = client.get("/export/2019/microdata.csv?columns=dpto,ht11&where=dpto:1,3")
+    assert response.status_code == 200
+    frame = pd.read_csv(io.BytesIO(response.data))
+    expected = survey.data.loc[survey.data["dpto"].isin([1, 3]), ["dpto", "ht11"]]
+    pd.testing.assert_frame_equal(frame, expected.reset_index(drop=True), check_dtype=False)
+
+
+@pytest.mark.parametrize("year", [2006, 2021, 1999999])
+def test_microdata_of_an_unknown_year_is_not_found(client, year):
+    response = client.get(f"/export/{year}/microdata.csv?columns=dpto")
+    assert response.status_code == 404
+    assert client.registry.years == []
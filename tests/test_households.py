@@ -0,0 +1,60 @@
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cache import SurveyCache
+from engine import AggregationEngine, VERIFY_RTOL
+from households import Households, load_households
+
+
+@pytest.fixture(scope="module")
+def first_rows(survey):
+    """`survey` with one row per household, taken with `groupby("numero").first()`."""
+    households = copy.copy(survey)
+    households.data = survey.data.groupby("numero", sort=False).first().reset_index()
+    households.weights = "pesoano"
+    households.splitter = []
+    return households
+
+
+def test_frame_holds_the_first_person_of_each_household(survey, first_rows):
+    households = Households.build(survey.data)
+    columns = ["numero", "dpto", "region_4", "c2", "ht11", "ht19", "pesoano"]
+    pd.testing.assert_frame_equal(households.frame[columns], first_rows.data[columns])
+    numero = households.frame["numero"].to_numpy()[households.person_household]
+    np.testing.assert_array_equal(numero, survey.data["numero"].to_numpy())
+
+
+@pytest.mark.parametrize(
+    "variable, by, aggfunc",
+    [
+        ("ht11", ["dpto"], "mean"),
+        ("ht11", ["region_4", "c2"], "sum"),
+        ("ht19", None, "count"),
+        ("c2", ["dpto"], "count"),
+    ],
+)
+def test_household_level_summaries_match_first_rows(engine, first_rows, variable, by, aggfunc):
+    result = engine.summarize(
+        variable, by, aggfunc=aggfunc, household_level=True, weights="pesoano"
+    )
+    expected = first_rows.summarize(variable, by, aggfunc=aggfunc)
+    pd.testing.assert_frame_equal(
+        result, expected.reset_index(drop=True), check_dtype=False, rtol=VERIFY_RTOL, atol=0
+    )
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_persisted_households_read_back_unchanged(survey, tmp_path, lazy):
+    surveys = SurveyCache(str(tmp_path))
+    surveys.write(2019, survey)
+    read = surveys.read(2019, lazy=lazy)
+    built = load_households(read, surveys)
+    loaded = load_households(read, surveys)
+    assert loaded is not built
+    np.testing.assert_array_equal(loaded.rows, built.rows)
+    np.testing.assert_array_equal(loaded.person_household, built.person_household)
+    frame = loaded.frame.to_frame() if lazy else loaded.frame
+    pd.testing.assert_frame_equal(frame, Households.build(survey.data).frame)
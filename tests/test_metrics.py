@@ -0,0 +1,89 @@
+import time
+
+import pytest
+from flask import Flask
+
+import metrics
+from metrics import Profiler, phase
+from registry import SurveyRegistry
+from results import SummaryCache
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = Flask(__name__)
+    metrics.register_route(server)
+    monkeypatch.setattr(metrics, "_gauges", {})
+    return server
+
+
+def call(server, name, func, body=b"{}"):
+    with server.test_request_context(method="POST", data=body):
+        return metrics.instrument_callback(name, func)()
+
+
+def test_metrics_route_serves_callbacks_and_gauges(server):
+    def update_graph():
+        with phase("aggregate"):
+            time.sleep(0.01)
+        return "x" * 300
+
+    # The gauges app.py registers.
+    registry = SurveyRegistry(loader=lambda year, progress=None: None, memory_budget=1)
+    summary_cache = SummaryCache()
+    summary_cache.get("missing")
+    metrics.register_gauges("registry", registry.stats)
+    metrics.register_gauges("summary_cache", summary_cache.stats)
+    call(server, "update_graph", update_graph, body=b"y" * 500)
+    response = server.test_client().get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert "version=0.0.4" in response.content_type
+    lines = response.get_data(as_text=True).splitlines()
+    for line in [
+        '# TYPE pyech_callback_seconds histogram',
+        'pyech_callback_seconds_count{callback="update_graph"} 1',
+        'pyech_phase_seconds_count{callback="update_graph",phase="aggregate"} 1',
+        'pyech_phase_seconds_count{callback="update_graph",phase="dispatch"} 1',
+        'pyech_callback_request_bytes_sum{callback="update_graph"} 500.0',
+        'pyech_callback_response_bytes_sum{callback="update_graph"} 300.0',
+        "pyech_registry_hits 0",
+        "pyech_registry_evictions 0",
+        "pyech_registry_nbytes 0",
+        "pyech_registry_memory_budget 1",
+        "pyech_summary_cache_misses 1",
+        "pyech_summary_cache_disk_hits 0",
+        "pyech_summary_cache_hit_rate 0.0",
+    ]:
+        assert line in lines
+    # Only numeric stats are exposed.
+    assert not any(line.startswith("pyech_registry_years") for line in lines)
+
+
+def test_profiler_is_off_unless_a_threshold_is_set(monkeypatch):
+    monkeypatch.delenv("PYECH_PROFILE_SLOW_MS", raising=False)
+    assert not Profiler.from_environment().enabled
+    assert Profiler.from_environment().start() is None
+    monkeypatch.setenv("PYECH_PROFILE_SLOW_MS", "250")
+    monkeypatch.setenv("PYECH_PROFILE_INTERVAL_MS", "2")
+    profiler = Profiler.from_environment()
+    assert profiler.enabled
+    assert (profiler.slow, profiler.interval) == (0.25, 0.002)
+
+
+@pytest.mark.parametrize("slow_ms, written", [(10, True), (10_000, False)])
+def test_profiler_writes_the_stacks_of_slow_callbacks(
+    server, monkeypatch, tmp_path, slow_ms, written
+):
+    def slow_callback():
+        time.sleep(0.05)
+        return ""
+
+    monkeypatch.setattr(metrics, "profiler", Profiler(slow_ms / 1000, 0.002, str(tmp_path)))
+    call(server, "slow_callback", slow_callback)
+    files = list(tmp_path.glob("slow_callback-*.folded"))
+    assert len(files) == written
+    if written:
+        stacks = files[0].read_text().splitlines()
+        assert stacks and all(line.rsplit(" ", 1)[1].isdigit() for line in stacks)
+        assert any("slow_callback (test_metrics.py" in line for line in stacks)
@@ -0,0 +1,134 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cache import SurveyCache
+from registry import FAILED, QUEUED, READY, SurveyRegistry, survey_nbytes
+
+
+def fake_survey(rows: int = 1000):
+    return SimpleNamespace(
+        data=pd.DataFrame({"x": np.zeros(rows)}), dictionary=pd.DataFrame({"Nombre": ["x"]})
+    )
+
+
+def test_least_recently_used_years_are_evicted_first():
+    surveys = {year: fake_survey() for year in (2017, 2018, 2019)}
+    size = survey_nbytes(surveys[2017])
+    registry = SurveyRegistry(
+        loader=lambda year, progress=None: surveys[year], memory_budget=2 * size
+    )
+    registry.get(2017)
+    registry.get(2018)
+    registry.get(2017)
+    registry.get(2019)
+    assert list(registry.stats()["years"]) == [2017, 2019]
+    assert registry.nbytes == 2 * size
+    assert (registry.hits, registry.misses, registry.evictions) == (1, 3, 1)
+
+
+def test_the_last_survey_is_kept_over_budget():
+    registry = SurveyRegistry(loader=lambda year, progress=None: fake_survey(), memory_budget=1)
+    registry.get(2018)
+    registry.get(2019)
+    assert 2018 not in registry
+    assert 2019 in registry
+    assert registry.evictions == 1
+
+
+def test_materialized_columns_count_towards_the_budget(survey):
+    cache = SurveyCache()
+    for year in (2018, 2019):
+        cache.write(year, survey)
+    registry = SurveyRegistry(loader=lambda year, progress=None: cache.read(year, lazy=True))
+    older, newer = registry.get(2018), registry.get(2019)
+    before = registry.nbytes
+    older.data["ht11"]
+    assert registry.nbytes == before + older.data["ht11"].memory_usage(index=False, deep=True)
+
+    registry.memory_budget = registry.nbytes
+    newer.data["pt1"]
+    assert 2018 not in registry
+    assert 2019 in registry
+
+
+class NoLock:
+    def __enter__(self):
+        raise AssertionError("the lock was taken")
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_views_of_loaded_years_take_no_lock(survey):
+    registry = SurveyRegistry(loader=lambda year, progress=None: survey)
+    registry.put(2019, survey, {"engine": "built"})
+    registry._lock = NoLock()
+    view = registry.view(2019, "pesoano")
+    assert view.survey is survey
+    assert view.derived("engine") == "built"
+    assert registry.hits == 1
+
+
+def test_materializing_a_column_enforces_the_budget(survey, monkeypatch):
+    calls = []
+    monkeypatch.setattr(SurveyRegistry, "_enforce_budget", lambda self: calls.append(self))
+    SurveyCache().write(2019, survey)
+    registry = SurveyRegistry(
+        loader=lambda year, progress=None: SurveyCache().read(year, lazy=True)
+    )
+    lazy = registry.get(2019)
+    lazy.data["e27"]
+    lazy.data["e27"]
+    assert calls == [registry]
+
+
+def test_concurrent_requests_for_a_year_load_it_once():
+    calls = []
+    release = threading.Event()
+
+    def loader(year, progress=None):
+        calls.append(year)
+        release.wait(5)
+        return fake_survey()
+
+    registry = SurveyRegistry(loader=loader)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(registry.get(2019))) for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    # Every thread asks while the load is still in flight.
+    time.sleep(0.2)
+    assert registry.status(2019) == QUEUED
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [2019]
+    assert len(results) == 8 and all(r is results[0] for r in results)
+    assert (registry.misses, registry.hits) == (1, 0)
+
+
+def test_failed_loads_are_reported_and_retried():
+    attempts = []
+
+    def loader(year, progress=None):
+        attempts.append(year)
+        if len(attempts) == 1:
+            raise OSError("download failed")
+        return fake_survey()
+
+    registry = SurveyRegistry(loader=loader)
+    with pytest.raises(OSError):
+        registry.get(2019)
+    assert registry.status(2019) == FAILED
+    assert str(registry.error(2019)) == "download failed"
+    registry.get(2019)
+    assert registry.status(2019) == READY
+    assert registry.error(2019) is None
+    assert attempts == [2019, 2019]
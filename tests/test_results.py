@@ -0,0 +1,94 @@
+import os
+
+import pandas as pd
+
+from engine import AggregationEngine
+from results import ResultStore, SummaryCache, SummarySpec, frame_records
+
+from benchmarks.synthetic import make_survey
+
+
+def summarize(engine, spec):
+    return engine.summarize(spec.sumvar, list(spec.by), weights=spec.weights)
+
+
+def test_reordered_groupers_match_direct_summary():
+    # Few households, so that some combinations of the groupers are absent.
+    engine = AggregationEngine(make_survey(2019, households=60, extra_columns=0))
+    cache = SummaryCache()
+    spec = SummarySpec.create(2019, "pesoano", "ht11", ["dpto", "pobpcoac"], "mean", False, False)
+    reordered = spec._replace(by=("pobpcoac", "dpto"))
+    expected = summarize(engine, reordered)
+    engine.clear_rollups()
+    cache.get_or_compute(spec, lambda: summarize(engine, spec))
+    result = cache.get_or_compute(reordered, lambda: summarize(engine, reordered))
+    assert result.equals(expected)
+
+
+def test_store_persists_partially_labelled_groupers(partially_labelled, tmp_path):
+    summary = AggregationEngine(partially_labelled).summarize("ht11", ["dpto"], weights="pesoano")
+    handle = "0" * 40
+    ResultStore(directory=str(tmp_path)).put(handle, summary)
+    stored = ResultStore(directory=str(tmp_path)).get(handle)
+    assert stored["dpto"].tolist() == summary["dpto"].tolist()
+    assert stored["ht11"].tolist() == summary["ht11"].tolist()
+
+
+def test_store_persists_mixed_object_columns(tmp_path):
+    frame = pd.DataFrame({"dpto": ["Montevideo", 19.0, None], "ht11": [1.0, 2.0, 3.0]})
+    handle = "1" * 40
+    ResultStore(directory=str(tmp_path)).put(handle, frame)
+    stored = ResultStore(directory=str(tmp_path)).get(handle)
+    assert stored["dpto"].tolist() == ["Montevideo", "19.0", None]
+
+
+def test_records_keep_floats_exactly():
+    frame = pd.DataFrame({"x": [0.1 + 0.2, 1 / 3, float("nan")], "dpto": ["a", None, "b"]})
+    records = frame_records(frame)
+    assert [r["x"] for r in records] == [0.1 + 0.2, 1 / 3, None]
+    assert [r["dpto"] for r in records] == ["a", None, "b"]
+
+
+def specs(n):
+    return [
+        SummarySpec.create(2019, "pesoano", f"v{i}", ["dpto"], "mean", False, False)
+        for i in range(n)
+    ]
+
+
+def test_pickled_summaries_stay_under_the_disk_cap(tmp_path):
+    frame = pd.DataFrame({"x": range(1000)}, dtype="float64")
+    cache = SummaryCache(max_bytes=0, directory=str(tmp_path), max_disk_bytes=30_000)
+    first, *rest = specs(6)
+    cache.put(first, frame)
+    for i, spec in enumerate(rest):
+        # Reading the first one keeps it the most recently used.
+        os.utime(cache._path(first), (i, i))
+        assert cache.get(first) is not None
+        cache.put(spec, frame)
+    sizes = [f.stat().st_size for f in tmp_path.rglob("*.pkl")]
+    assert sum(sizes) <= 30_000
+    assert cache.get(first) is not None
+    assert cache.get(rest[0]) is None
+
+
+def test_corrupt_pickles_are_misses(tmp_path):
+    cache = SummaryCache(max_bytes=0, directory=str(tmp_path))
+    spec = specs(1)[0]
+    cache.put(spec, pd.DataFrame({"x": [1.0, 2.0]}))
+    with open(cache._path(spec), "r+b") as f:
+        f.truncate(20)
+    assert cache.get(spec) is None
+    assert not os.path.exists(cache._path(spec))
+
+
+def test_stored_results_stay_under_the_disk_cap(tmp_path):
+    frame = pd.DataFrame({"x": range(1000)}, dtype="float64")
+    store = ResultStore(max_bytes=0, directory=str(tmp_path), max_disk_bytes=30_000)
+    handles = [f"{i:040x}" for i in range(8)]
+    for handle in handles:
+        store.put(handle, frame)
+    sizes = [f.stat().st_size for f in tmp_path.rglob("*.arrow")]
+    assert 0 < sum(sizes) <= 30_000
+    assert store.get(handles[0]) is None
+    assert store.get(handles[-1]) is not None
@@ -0,0 +1,10 @@
+from benchmarks.stress import run
+
+
+def test_views_stay_consistent_across_reloads_and_evictions():
+    counts, failures = run(households=150, extra_columns=0, threads=4, seconds=2, evict=True)
+    assert not failures, failures[0]
+    assert counts["summaries"] > 0
+    assert counts["swaps"] > 0
+    assert counts["evictions"] > 0
+    assert counts["loads"] > 0
@@ -0,0 +1,42 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import timeseries
+from cache import SurveyCache
+from results import SummarySpec
+
+
+def spec(year, weights="pesoano"):
+    return SummarySpec.create(year, weights, "ht11", ["dpto"], "mean", False, False)
+
+
+def test_year_without_the_weights_is_reported(survey):
+    SurveyCache().write(2019, survey)
+    year, summary, error = timeseries.summarize_year(spec(2019, weights="pesomen2"))
+    assert summary is None
+    assert error == "sin pesomen2"
+
+
+class BrokenPool:
+    def __init__(self, broken):
+        self.broken = broken
+
+    def submit(self, fn, year_spec):
+        future = Future()
+        if year_spec.year in self.broken:
+            future.set_exception(BrokenProcessPool("a worker died"))
+        else:
+            future.set_result(fn(year_spec))
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def test_failed_years_are_reported(survey, monkeypatch):
+    SurveyCache().write(2019, survey)
+    monkeypatch.setattr(timeseries, "get_pool", lambda: BrokenPool({2018}))
+    series, missing = timeseries.summarize_years(spec(2019), [2018, 2019])
+    assert set(series[timeseries.YEAR_COLUMN]) == {2019}
+    assert list(missing) == [2018]
+    assert "a worker died" in missing[2018]
@@ -0,0 +1,49 @@
+"""Figure theme shared with the clientside chart callbacks.
+
+Building it imports plotly.express and dash-bootstrap-templates and renders the
+template, which is slow on a cold start. ``python theme.py`` writes a snapshot to
+`THEME_FILE` at build time, and the app reads it when present.
+"""
+import json
+import os
+
+
+TEMPLATE = "flatly"
+THEME_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "theme.json")
+
+
+def build_theme() -> dict:
+    import plotly.express as px
+    import plotly.io as pio
+    from dash_bootstrap_templates import load_figure_template
+
+    load_figure_template(TEMPLATE)
+    pio.templates[TEMPLATE].layout.margin = {"l": 10, "r": 10}
+    return {
+        "template": pio.templates[TEMPLATE].to_plotly_json(),
+        "colorway": list(px.colors.qualitative.Prism),
+        "colorscale": list(px.colors.sequential.thermal),
+    }
+
+
+def load_theme() -> dict:
+    try:
+        with open(THEME_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return build_theme()
+
+
+def main():
+    from plotly.utils import PlotlyJSONEncoder
+
+    os.makedirs(os.path.dirname(THEME_FILE), exist_ok=True)
+    tmp_path = f"{THEME_FILE}.tmp{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(build_theme(), f, cls=PlotlyJSONEncoder)
+    os.replace(tmp_path, THEME_FILE)
+    print(f"Theme written to {THEME_FILE}")
+
+
+if __name__ == "__main__":
+    main()
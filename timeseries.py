@@ -0,0 +1,133 @@
+"""Run one summary spec over a range of survey years in parallel worker processes.
+
+Each worker loads its year from the on-disk cache and aggregates it with the engine, so
+the parent process only stacks the per-year results into a long frame with an `anio`
+column. Years that lack a variable or the weights, or fail to load or summarize, are
+reported instead of failing the whole batch.
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from cache import SurveyCache
+from engine import AggregationEngine
+from results import SummarySpec
+
+
+YEAR_COLUMN = "anio"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            max_workers = int(
+                os.environ.get("PYECH_SERIES_WORKERS", min(4, os.cpu_count() or 1))
+            )
+            # gunicorn workers are multi-threaded, so never fork them.
+            _pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def discard_pool(pool: ProcessPoolExecutor):
+    """Drop `pool` after one of its workers died, so the next batch starts a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def summarize_year(spec: SummarySpec) -> Tuple[int, Optional[pd.DataFrame], Optional[str]]:
+    try:
+        survey = SurveyCache().load(spec.year)
+    except Exception as e:
+        return spec.year, None, f"error al cargar ({e})"
+    variables = (
+        spec.sumvar,
+        spec.weights,
+        *spec.by,
+        *(spec.where.variables if spec.where else ()),
+    )
+    missing = [c for c in variables if c not in survey.data.columns]
+    if missing:
+        return spec.year, None, f"sin {', '.join(missing)}"
+    try:
+        engine = AggregationEngine(survey, precompute=False)
+        summary = engine.summarize(
+            spec.sumvar,
+            list(spec.by),
+            aggfunc=spec.aggfunc,
+            is_categorical=spec.is_categorical,
+            household_level=spec.household_level,
+            weights=spec.weights,
+            errors=spec.errors,
+            where=spec.where,
+        )
+    except Exception as e:
+        return spec.year, None, f"error al resumir ({e})"
+    return spec.year, summary, None
+
+
+def summarize_years(
+    spec: SummarySpec,
+    years: List[int],
+    cached: Callable[[SummarySpec], Optional[pd.DataFrame]] = None,
+    store: Callable[[SummarySpec, pd.DataFrame], None] = None,
+) -> Tuple[pd.DataFrame, Dict[int, str]]:
+    """Summarize `spec` for every year in `years`.
+
+    `cached` and `store` let the caller serve and keep per-year results in its own cache;
+    only the years missing from it are sent to the process pool.
+    """
+    summaries: Dict[int, pd.DataFrame] = {}
+    missing: Dict[int, str] = {}
+    pending = []
+    for year in years:
+        year_spec = spec._replace(year=int(year))
+        summary = cached(year_spec) if cached else None
+        if summary is None:
+            pending.append(year_spec)
+        else:
+            summaries[year_spec.year] = summary
+    if pending:
+        pool = get_pool()
+        futures = {
+            pool.submit(summarize_year, year_spec): year_spec.year for year_spec in pending
+        }
+        for future in as_completed(futures):
+            try:
+                year, summary, error = future.result()
+            except BrokenProcessPool as e:
+                discard_pool(pool)
+                year, summary, error = futures[future], None, f"error del proceso ({e})"
+            except Exception as e:
+                year, summary, error = futures[future], None, f"error ({e})"
+            if error:
+                missing[year] = error
+                continue
+            summaries[year] = summary
+            if store:
+                store(spec._replace(year=year), summary)
+    frames = []
+    for year in sorted(summaries):
+        summary = summaries[year]
+        if YEAR_COLUMN not in summary.columns:
+            summary = summary.copy()
+            summary.insert(0, YEAR_COLUMN, year)
+        frames.append(summary)
+    series = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return series, dict(sorted(missing.items()))